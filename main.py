@@ -1,18 +1,2866 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox, ttk
 import os
+import sys
+import csv
+import json
+import sqlite3
+import gc
+import gzip
+import time
+import random
+import argparse
+import array
+import bisect
+import glob
+import hashlib
+import heapq
+import itertools
 import threading
-from datetime import datetime
+import multiprocessing
+import cProfile
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import mysql.connector
 import fitz  # PyMuPDF
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+try:
+    import zstandard
+except ImportError:  # the PDF archive falls back to deflate
+    zstandard = None
+
 CONFIG_FILE = "shimadzu_machine_config.txt"
 DB_CONFIG_FILE = "shimadzu_database_config.txt"
+RESOURCE_LOG_FILE = "batch_resources_log.txt"
+INGEST_CHECKPOINT_FILE = "ingest_checkpoint.json"
+LAYOUT_PROFILE_FILE = "layout_profiles.json"
+LOCAL_MIRROR_FILE = "shimadzu_local_mirror.db"
+SQLITE_DB_FILE = "shimadzu_results.db"
+STORAGE_BACKENDS = ["mysql", "sqlite"]
+AUDIT_INDEX_FILE = "audit_index.db"
+LOADTEST_DB_FILE = "loadtest.db"
+
+# Result tables and the column holding their insert time (used for date filters)
+RESULT_TABLES = {
+    "shimadzu_lc2050_results": "created_at",
+    "shimadzu_lc2050_multicom_raw": "created_at",
+    "shimadzu_dissolution_raw": "timestamp",
+}
+# Compound filter column per table (the single compound table has no compound_name)
+COMPOUND_COLUMNS = {
+    "shimadzu_lc2050_results": "sample_name_header",
+    "shimadzu_lc2050_multicom_raw": "compound_name",
+    "shimadzu_dissolution_raw": "compound_name",
+}
+# Table definitions in MySQL syntax; SQLiteBackend translates the few dialect differences
+TABLE_SCHEMAS = {
+    "shimadzu_lc2050_results": [
+        "id INT AUTO_INCREMENT PRIMARY KEY",
+        "machine_id VARCHAR(50)", "u_id VARCHAR(100)", "user_id VARCHAR(100)", "test_code VARCHAR(100)", "acquired_by VARCHAR(100)",
+        "sample_name_header VARCHAR(100)", "sample_id VARCHAR(100)", "tray VARCHAR(50)", "vial VARCHAR(50)",
+        "injection_volume VARCHAR(50)", "data_file VARCHAR(255)", "method_file VARCHAR(255)", "batch_file VARCHAR(255)",
+        "report_format_file VARCHAR(255)", "date_acquired VARCHAR(100)", "date_processed VARCHAR(100)",
+        "title VARCHAR(150)", "sample_name VARCHAR(150)", "sample_id_ind VARCHAR(150)",
+        "ret_time VARCHAR(50)", "area VARCHAR(50)", "tailing_factor VARCHAR(50)", "theoretical_plate VARCHAR(50)",
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    ],
+    "shimadzu_lc2050_multicom_raw": [
+        "id INT AUTO_INCREMENT PRIMARY KEY",
+        "machine_id VARCHAR(50)", "u_id VARCHAR(100)", "user_id VARCHAR(100)", "test_code VARCHAR(100)",
+        "acquired_by VARCHAR(100)", "sample_name_header VARCHAR(100)", "sample_id VARCHAR(100)", "tray VARCHAR(50)",
+        "vial VARCHAR(50)", "injection_volume VARCHAR(50)", "data_file VARCHAR(255)", "method_file VARCHAR(255)",
+        "batch_file VARCHAR(255)", "report_format_file VARCHAR(255)", "date_acquired VARCHAR(100)", "date_processed VARCHAR(100)",
+        "compound_name VARCHAR(150)", "title VARCHAR(150)", "sample_name VARCHAR(150)", "sample_id_ind VARCHAR(150)",
+        "ret_time VARCHAR(50)", "area VARCHAR(50)", "tailing_factor VARCHAR(50)", "theoretical_plate VARCHAR(50)",
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    ],
+    "shimadzu_dissolution_raw": [
+        "id INT AUTO_INCREMENT PRIMARY KEY",
+        "machine_id VARCHAR(50)", "u_id VARCHAR(100)", "user_id VARCHAR(100)", "test_code VARCHAR(100)",
+        "acquired_by VARCHAR(100)", "sample_name_header VARCHAR(100)", "sample_id VARCHAR(100)",
+        "tray VARCHAR(50)", "vial VARCHAR(50)", "injection_volume VARCHAR(50)",
+        "data_file VARCHAR(255)", "method_file VARCHAR(255)", "batch_file VARCHAR(255)",
+        "report_format_file VARCHAR(255)", "date_acquired VARCHAR(100)", "date_processed VARCHAR(100)",
+        "compound_name VARCHAR(150)", "title VARCHAR(150)", "sample_name VARCHAR(150)", "sample_id_ind VARCHAR(150)",
+        "ret_time VARCHAR(50)", "area VARCHAR(50)", "height VARCHAR(50)", "tailing_factor VARCHAR(50)", "theoretical_plate VARCHAR(50)",
+        "component_type VARCHAR(50)", "process_type VARCHAR(50)", "medium_name VARCHAR(100)",
+        "stage VARCHAR(20)", "vessel_id VARCHAR(20)",
+        "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP",
+    ],
+    # Running per-stage/vessel aggregates, kept up to date by update_dissolution_summary()
+    "shimadzu_dissolution_summary": [
+        "u_id VARCHAR(100) NOT NULL", "test_code VARCHAR(100) NOT NULL",
+        "compound_name VARCHAR(150) NOT NULL", "stage VARCHAR(20) NOT NULL", "vessel_id VARCHAR(20) NOT NULL",
+        "n INT NOT NULL", "area_sum DOUBLE NOT NULL", "area_sumsq DOUBLE NOT NULL",
+        "area_min DOUBLE", "area_max DOUBLE",
+        "std_stage VARCHAR(20)", "std_mean DOUBLE",
+        "updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+        "PRIMARY KEY (u_id, test_code, compound_name, stage, vessel_id)",
+    ],
+}
+# Normalized layout (opt-in, "migrate-schema"): one injection row per report, narrow peak rows,
+# and views named like the flat tables so existing queries keep working
+INJECTION_COLUMNS = [
+    "machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header", "sample_id",
+    "tray", "vial", "injection_volume", "data_file", "method_file", "batch_file", "report_format_file",
+    "date_acquired", "date_processed", "component_type", "process_type", "medium_name", "stage", "vessel_id",
+]
+PEAK_COLUMNS = ["compound_name", "title", "sample_name", "sample_id_ind", "ret_time", "area", "height",
+                "tailing_factor", "theoretical_plate"]
+NORMALIZED_SCHEMAS = {
+    "shimadzu_injection": [
+        "id INT AUTO_INCREMENT PRIMARY KEY", "source_table VARCHAR(64) NOT NULL",
+        "machine_id VARCHAR(50)", "u_id VARCHAR(100)", "user_id VARCHAR(100)", "test_code VARCHAR(100)",
+        "acquired_by VARCHAR(100)", "sample_name_header VARCHAR(100)", "sample_id VARCHAR(100)",
+        "tray VARCHAR(50)", "vial VARCHAR(50)", "injection_volume VARCHAR(50)",
+        "data_file VARCHAR(255)", "method_file VARCHAR(255)", "batch_file VARCHAR(255)",
+        "report_format_file VARCHAR(255)", "date_acquired VARCHAR(100)", "date_processed VARCHAR(100)",
+        "component_type VARCHAR(50)", "process_type VARCHAR(50)", "medium_name VARCHAR(100)",
+        "stage VARCHAR(20)", "vessel_id VARCHAR(20)",
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    ],
+    "shimadzu_peak": [
+        "id INT AUTO_INCREMENT PRIMARY KEY", "injection_id INT NOT NULL",
+        "compound_name VARCHAR(150)", "title VARCHAR(150)", "sample_name VARCHAR(150)", "sample_id_ind VARCHAR(150)",
+        "ret_time VARCHAR(50)", "area VARCHAR(50)", "height VARCHAR(50)", "tailing_factor VARCHAR(50)",
+        "theoretical_plate VARCHAR(50)",
+    ],
+}
+# Secondary indexes backing the History search / keyset pagination
+RESULT_INDEXES = ["u_id", "sample_id", "test_code", "data_file"]
+EXPORT_CHUNK_SIZE = 5000
+HISTORY_PAGE_SIZE = 200
+MIRROR_SYNC_CHUNK = 2000
+MIRROR_SYNC_LOOKBACK = 10000  # ids re-read behind the watermark: rows of a transaction still open at the last sync
+REPLAY_CHUNK = 5000
+# Table written by each "Inserted Row (<source>)" block of the legacy log_<date>.txt files
+LEGACY_LOG_TABLES = {"single": "shimadzu_lc2050_results", "multi": "shimadzu_lc2050_multicom_raw"}
+
+ASSAY_TEST_CODES = [str(i) for i in range(10003, 10027)]
+DISSOLUTION_TEST_CODES = ["10010", "10011"]
+# Release type per dissolution stage prefix (CS/SS are the standards)
+STAGE_RELEASE_TYPES = {"S": "immediate", "V": "delayed", "L": "extended"}
+DISSOLUTION_STAGES = ["CS", "SS"] + [p + str(n) for p in STAGE_RELEASE_TYPES for n in (1, 2, 3)]
+SINGLE_INSERT_COLUMNS = [
+    "machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header", "sample_id",
+    "tray", "vial", "injection_volume", "data_file", "method_file",
+    "batch_file", "report_format_file", "date_acquired", "date_processed",
+    "title", "sample_name", "sample_id_ind", "ret_time", "area",
+    "tailing_factor", "theoretical_plate"
+]
+MULTI_INSERT_COLUMNS = SINGLE_INSERT_COLUMNS[:16] + ["compound_name"] + SINGLE_INSERT_COLUMNS[16:]
+DISSOLUTION_INSERT_COLUMNS = [
+    "machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header",
+    "sample_id", "tray", "vial", "injection_volume", "report_format_file", "date_processed",
+    "data_file", "method_file", "batch_file", "date_acquired",
+    "title", "sample_name", "ret_time", "area", "height", "tailing_factor", "theoretical_plate",
+    "component_type", "process_type", "medium_name", "stage", "vessel_id",
+    "compound_name", "sample_id_ind"
+]
+# Plate-count column label, depending on the report format (most common first)
+PLATE_LABELS = ["Theoretical Plate", "Theoretical Plate(USP)", "Number of Theoretical Plate(USP)"]
+# Per-table statistic rows printed under the peaks; never counted as injections
+SUMMARY_ROW_TITLES = ["Average", "%RSD", "Standard Deviation", "Std. Dev."]
+# Peak table header labels the grid extraction keys its columns on
+TABLE_HEADER_LABELS = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Height", "Tailing Factor"] + PLATE_LABELS
+# Columns whose cells can wrap onto a second line (all others are numbers)
+TABLE_TEXT_LABELS = ["Title", "Sample Name", "Sample ID"]
+# Row field -> report header label; the value is on the line after the label's first occurrence
+REPORT_HEADER_FIELDS = {
+    "acquired_by": "Acquired by", "sample_name_header": "Sample Name", "sample_id": "Sample ID",
+    "tray": "Tray#", "vial": "Vial#", "injection_volume": "Injection Volume", "data_file": "Data File",
+    "method_file": "Method File", "batch_file": "Batch File", "report_format_file": "Report Format File",
+    "date_acquired": "Date Acquired", "date_processed": "Date Processed",
+}
+REPORT_HEADER_LABELS = list(REPORT_HEADER_FIELDS.values())
+# Multi-compound tables (line mode): the columns read, and the headers a column runs up to
+MULTI_COLUMN_LABELS = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Tailing Factor"] + PLATE_LABELS
+MULTI_STOP_HEADERS = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Tailing Factor",
+                      "Theoretical Plate", "Number of Theoretical Plate(USP)"]
+# Standards a stage is compared against, in order of preference
+STANDARD_STAGES = ["CS", "SS"]
+DISSOLUTION_SUMMARY_KEY = ["u_id", "test_code", "compound_name", "stage", "vessel_id"]
+# Row kind -> (table, insert columns, value for missing columns)
+INSERT_TARGETS = {
+    "single": ("shimadzu_lc2050_results", SINGLE_INSERT_COLUMNS, None),
+    "multi": ("shimadzu_lc2050_multicom_raw", MULTI_INSERT_COLUMNS, None),
+    "dissolution": ("shimadzu_dissolution_raw", DISSOLUTION_INSERT_COLUMNS, ""),
+}
+# Sequence grouping: reports of one Batch File more than this far apart start a new sequence
+SEQUENCE_GAP_MINUTES = 60
+ACQUIRED_FORMATS = ["%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"]
+EXTRACT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# Job scheduler: jobs from every tab share one queue, lower priority numbers run first.
+# Up to JOB_MAX_RUNNING jobs run at once (never two of one kind, they share a checkpoint)
+# and at most DB_MAX_WRITERS of them hold a write transaction at the same time.
+JOB_PRIORITIES = {"dissolution_standard": 0, "dissolution": 1, "assay": 1, "batch": 2}
+JOB_MAX_RUNNING = 2
+DB_MAX_WRITERS = 2
+JOBS_REFRESH_MS = 500
+# Read-ahead: a job reads up to PREFETCH_DEPTH of its next PDFs (network shares) while the
+# current one is parsed, on PREFETCH_WORKERS I/O threads shared by all jobs
+PREFETCH_DEPTH = 4
+PREFETCH_WORKERS = 4
+
+# --- Batch memory budget ---
+# Previews keep only the newest rows (everything is in the DB / Export), the status
+# log is trimmed, and going over the RSS budget forces a collection + a warning.
+PREVIEW_ROW_LIMIT = 1000
+STATUS_LOG_LINES = 2000
+BATCH_MEMORY_BUDGET_MB = 1024
+
+ETA_WINDOW = 10  # files used for the rolling throughput / ETA
+
+# --- DB retries ---
+# Connection drops, server restarts, lock wait timeouts and deadlocks are retried with
+# exponential backoff; anything else (bad SQL, data too long...) fails the file at once.
+RETRYABLE_DB_ERRNOS = {
+    1040,  # too many connections
+    1053,  # server shutdown in progress
+    1205,  # lock wait timeout
+    1213,  # deadlock
+    2002, 2003,  # can't connect
+    2006,  # server has gone away
+    2013, 2055,  # lost connection during query
+}
+DB_RETRY_ATTEMPTS = 5
+DB_RETRY_BASE_DELAY = 0.5
+DB_RETRY_MAX_DELAY = 15.0
+# Write connections kept open per backend for reuse (one per concurrent writer is enough)
+DB_POOL_SIZE = 2
+
+# --- Audit log ---
+# One JSON line per committed file (with its rows) in audit_<date>.jsonl. With compression
+# on, every record is its own gzip member, so indexed offsets stay directly seekable.
+AUDIT_COMPRESS = False
+AUDIT_INDEX_KEYS = ["u_id", "sample_id", "data_file"]
+# --- PDF archive ---
+# Every committed PDF is stored once under its SHA-256 (zstd, or deflate without zstandard)
+ARCHIVE_DIR = "pdf_archive"
+ARCHIVE_INDEX_FILE = "archive_index.db"
+# Chromatogram traces (optional): with SHIMADZU_TRACES=1 the plot polylines of each newly
+# archived report are stored next to it as float32 time / signal arrays
+TRACES_ENV = "SHIMADZU_TRACES"
+TRACE_MIN_POINTS = 50  # drawings with fewer points are axes, tick marks or boxes
+TRACE_AXIS_GAP = 30  # max distance (pt) between a plot frame and its tick labels
+TRACE_SIGNAL_UNITS = ["mAU", "mV", "uV", "µV", "AU", "V"]
+# Optional CSV copy of every committed row: <dir>/<table>_<date>.csv (off unless set)
+EXPORT_DIR_ENV = "SHIMADZU_EXPORT_DIR"
+
+# --- Metrics ---
+# Off unless one of these is set: a localhost Prometheus endpoint (/metrics) or a
+# text file rewritten every METRICS_FILE_INTERVAL seconds (node_exporter textfile format).
+METRICS_PORT_ENV = "SHIMADZU_METRICS_PORT"
+METRICS_FILE_ENV = "SHIMADZU_METRICS_FILE"
+METRICS_FILE_INTERVAL = 15
+METRIC_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+METRIC_HELP = {
+    "shimadzu_files_total": ("counter", "PDF files finished, by job kind and status"),
+    "shimadzu_rows_inserted_total": ("counter", "Rows committed, by table"),
+    "shimadzu_pdf_extract_seconds": ("histogram", "PDF text extraction time"),
+    "shimadzu_pdf_read_seconds": ("histogram", "Time to read one PDF from disk / share"),
+    "shimadzu_pdf_read_wait_seconds": ("histogram", "Time parsing waited for a PDF that was not read ahead yet"),
+    "shimadzu_db_transaction_seconds": ("histogram", "Time of one write transaction (connect to commit)"),
+    "shimadzu_db_retries_total": ("counter", "Transient DB errors that were retried"),
+    "shimadzu_db_unavailable_total": ("counter", "Writes abandoned after all retries"),
+    "shimadzu_pending_files": ("gauge", "Files still queued in the running job of each kind"),
+    "shimadzu_layout_profile_total": ("counter", "Layout profile lookups, by result (hit/miss)"),
+}
+
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples while profiling
+
+# Manifest header aliases -> canonical field
+MANIFEST_ALIASES = {
+    "file": "file", "file_name": "file", "filename": "file", "pdf": "file",
+    "data_file": "data_file", "u_id": "u_id", "uid": "u_id", "test_code": "test_code",
+    "stage": "stage", "vessel": "vessel", "vessel_id": "vessel", "user_id": "user_id",
+    "mode": "mode", "component_type": "component_type", "medium": "medium", "medium_name": "medium",
+}
 
 # --- UI SETTINGS ---
 ctk.set_appearance_mode("Light")  
 ctk.set_default_color_theme("blue")
 
+
+# =========================================================================
+# METRICS (Prometheus text format)
+# =========================================================================
+class Metrics:
+    """Process-wide counters, gauges and histograms; names and types are listed in METRIC_HELP"""
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> number, or [bucket counts..., sum, count] for histograms
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+    def render(self):
+        with self.lock:
+            snapshot = {key: (list(v) if isinstance(v, list) else v) for key, v in self.values.items()}
+        out = []
+        for name in sorted({name for name, _ in snapshot}):
+            kind, help_text = METRIC_HELP.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(snapshot.items(), key=lambda kv: str(kv[0])):
+                if metric != name:
+                    continue
+                if not isinstance(value, list):
+                    out.append(f"{name}{self._labels(labels)} {value}")
+                    continue
+                for bound, count in zip(self.buckets, value):
+                    out.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                out.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {value[-1]}")
+                out.append(f"{name}_sum{self._labels(labels)} {value[-2]}")
+                out.append(f"{name}_count{self._labels(labels)} {value[-1]}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+
+
+def start_metrics_http(port, metrics=METRICS):
+    """Serve metrics.render() at http://127.0.0.1:<port>/metrics from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # no per-scrape noise on the console
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_metrics_file(path, interval=METRICS_FILE_INTERVAL, metrics=METRICS):
+    """Rewrite path with metrics.render() every interval seconds from a daemon thread"""
+    def loop():
+        while True:
+            try:
+                tmp = path + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(metrics.render())
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Metrics file error: {e}")
+            time.sleep(interval)
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def start_metrics_from_env():
+    """Start the exporters configured through the environment; returns a short description"""
+    started = []
+    port = os.environ.get(METRICS_PORT_ENV, "").strip()
+    if port:
+        start_metrics_http(int(port))
+        started.append(f"http://127.0.0.1:{port}/metrics")
+    path = os.environ.get(METRICS_FILE_ENV, "").strip()
+    if path:
+        start_metrics_file(path)
+        started.append(path)
+    return ", ".join(started)
+
+
+# =========================================================================
+# DB HELPERS (shared by the app and the command line tools)
+# =========================================================================
+def read_db_config():
+    """Return (host, port, user, password, database) from the DB config file"""
+    with open(DB_CONFIG_FILE, "r") as f:
+        host, port, user, pwd, db = f.read().splitlines()[:5]
+    return host, port, user, pwd, db
+
+
+def read_storage_config():
+    """Return (backend, sqlite_path); lines 6-7 of the DB config file, MySQL when absent"""
+    lines = []
+    if os.path.exists(DB_CONFIG_FILE):
+        with open(DB_CONFIG_FILE, "r") as f:
+            lines = f.read().splitlines()
+    backend = lines[5].strip() if len(lines) > 5 and lines[5].strip() in STORAGE_BACKENDS else "mysql"
+    path = lines[6].strip() if len(lines) > 6 and lines[6].strip() else SQLITE_DB_FILE
+    return backend, path
+
+
+class StorageBackend:
+    """
+    Where result rows live. Connections follow the mysql.connector API (cursor(), commit(),
+    %s placeholders, lastrowid), so read paths such as History and Export work on any
+    backend; what differs per SQL dialect (DDL, upserts) is implemented here.
+    """
+    name = None
+
+    def __init__(self):
+        self._views = {}  # result table -> True once it was migrated to a compatibility view
+        self._sql = {}  # (table, columns) -> INSERT text, built once so drivers can reuse the statement
+        self._idle = []  # pooled write connections
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()  # connection of the transaction running on this thread
+        self.pool_size = DB_POOL_SIZE
+
+    def connect(self):
+        raise NotImplementedError
+
+    def acquire(self):
+        """A pooled connection (opened when none is idle or the idle one went away)"""
+        with self._pool_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is not None:
+            try:
+                if conn.is_connected():
+                    return conn
+            except Exception:
+                pass
+            self._discard(conn)
+        conn = self.connect()
+        conn.statements = {}  # sql -> cursor with the statement prepared on this connection
+        return conn
+
+    def release(self, conn):
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass  # already gone
+
+    def close(self):
+        """Close the idle pooled connections"""
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def statement(self, cursor, sql):
+        """
+        Cursor to run sql with inside transaction(). SQLite reuses its compiled statements per
+        connection by itself; MySQL overrides this with server-side prepared statements.
+        """
+        return cursor
+
+    def insert_sql(self, table, columns):
+        """INSERT text for a table / column list, built once per backend"""
+        key = (table, tuple(columns))
+        sql = self._sql.get(key)
+        if sql is None:
+            sql = self._sql[key] = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                                    f"VALUES ({', '.join(['%s'] * len(columns))})")
+        return sql
+
+    def object_type(self, cursor, name):
+        """'table', 'view' or None"""
+        raise NotImplementedError
+
+    def create_view(self, cursor, name, select_sql):
+        raise NotImplementedError
+
+    def is_normalized(self, cursor, table):
+        if table not in self._views:
+            self._views[table] = self.object_type(cursor, table) == "view"
+        return self._views[table]
+
+    def column_sql(self, definition):
+        return definition
+
+    def create_index(self, cursor, table, column):
+        raise NotImplementedError
+
+    def init_schema(self):
+        """Create all tables and History indexes if missing"""
+        def create(cursor):
+            for table, columns in TABLE_SCHEMAS.items():
+                if table in RESULT_TABLES and self.is_normalized(cursor, table):
+                    continue  # migrated: the name is a view over shimadzu_injection / shimadzu_peak
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(self.column_sql(c) for c in columns)})")
+            for table in RESULT_TABLES:
+                if not self.is_normalized(cursor, table):
+                    for col in RESULT_INDEXES:
+                        self.create_index(cursor, table, col)
+        self.transaction(create)
+
+    def init_normalized_schema(self):
+        def create(cursor):
+            for table, columns in NORMALIZED_SCHEMAS.items():
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(self.column_sql(c) for c in columns)})")
+            for col in RESULT_INDEXES:
+                self.create_index(cursor, "shimadzu_injection", col)
+            self.create_index(cursor, "shimadzu_peak", "injection_id")
+        self.transaction(create)
+
+    def transaction(self, fn):
+        """Run fn(cursor) on a pooled connection, commit and return its result (rolled back on error)"""
+        started = time.perf_counter()
+        conn = self.acquire()
+        self._local.conn = conn
+        try:
+            result = fn(conn.cursor())
+            conn.commit()
+            METRICS.observe("shimadzu_db_transaction_seconds", time.perf_counter() - started, backend=self.name)
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass  # the connection is already gone
+            self._discard(conn)  # never hand a failed connection to the next writer
+            raise
+        finally:
+            self._local.conn = None
+        self.release(conn)
+        return result
+
+    def insert_rows(self, cursor, table, columns, rows, default=None):
+        """Insert row dicts (missing columns get default); returns [(id, row dict)] in insert order"""
+        if self.is_normalized(cursor, table):
+            return self.insert_normalized(cursor, table, columns, rows, default)
+        sql = self.insert_sql(table, columns)
+        insert = self.statement(cursor, sql)
+        inserted = []
+        for row in rows:
+            values = tuple(row.get(col, default) for col in columns)
+            insert.execute(sql, values)
+            inserted.append((insert.lastrowid, dict(zip(columns, values))))
+        return inserted
+
+    def bulk_insert(self, cursor, table, columns, value_rows):
+        """Insert value tuples without reading back ids (one executemany on flat tables)"""
+        if self.is_normalized(cursor, table):
+            self.insert_normalized(cursor, table, columns, [dict(zip(columns, v)) for v in value_rows])
+        else:
+            cursor.executemany(self.insert_sql(table, columns), value_rows)
+
+    def insert_normalized(self, cursor, table, columns, rows, default=None, injections=None):
+        """
+        insert_rows() for a migrated table: rows sharing the same header values become one
+        shimadzu_injection row, each row one shimadzu_peak row. Returns [(peak id, row dict)].
+        injections caches header -> injection id across calls (used by the migration).
+        """
+        date_col = RESULT_TABLES[table]
+        unknown = [c for c in columns if c not in INJECTION_COLUMNS and c not in PEAK_COLUMNS and c != date_col]
+        if unknown:
+            raise ValueError(f"Columns not in the normalized schema: {unknown}")
+        inj_cols = [c for c in columns if c in INJECTION_COLUMNS] + ([date_col] if date_col in columns else [])
+        peak_cols = [c for c in columns if c in PEAK_COLUMNS]
+        inj_sql = self.insert_sql("shimadzu_injection",
+                                  ["source_table"] + ["created_at" if c == date_col else c for c in inj_cols])
+        peak_sql = self.insert_sql("shimadzu_peak", ["injection_id"] + peak_cols)
+        insert_injection, insert_peak = self.statement(cursor, inj_sql), self.statement(cursor, peak_sql)
+        injections = {} if injections is None else injections
+        inserted = []
+        for row in rows:
+            values = dict(zip(columns, (row.get(col, default) for col in columns)))
+            key = (table,) + tuple(values[c] for c in inj_cols)
+            injection_id = injections.get(key)
+            if injection_id is None:
+                insert_injection.execute(inj_sql, key)
+                injection_id = injections[key] = insert_injection.lastrowid
+            insert_peak.execute(peak_sql, (injection_id,) + tuple(values[c] for c in peak_cols))
+            inserted.append((insert_peak.lastrowid, values))
+        return inserted
+
+    def upsert_sql(self, table, key_columns, value_columns, merge, touch=()):
+        raise NotImplementedError
+
+    def upsert(self, cursor, table, key_columns, value_columns, rows, merge, touch=()):
+        """
+        Insert key+value tuples; on an existing key each value column is merged
+        with the stored one as merge[col] says: "add", "min" or "max", and the
+        touch columns are set to the current time (SQLite has no ON UPDATE).
+        """
+        cursor.executemany(self.upsert_sql(table, key_columns, value_columns, merge, touch), rows)
+
+
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+    MERGE_SQL = {"add": "{c} + VALUES({c})", "min": "LEAST({c}, VALUES({c}))", "max": "GREATEST({c}, VALUES({c}))"}
+    NOW_SQL = "CURRENT_TIMESTAMP"
+
+    def connect(self):
+        host, port, user, pwd, db = read_db_config()
+        return mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
+
+    def statement(self, cursor, sql):
+        """A prepared-statement cursor for sql, prepared once per pooled connection and reused"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return cursor  # not inside transaction()
+        prepared = conn.statements.get(sql)
+        if prepared is None:
+            # The cursor prepares on its first execute and keeps the statement while sql stays the same object
+            prepared = conn.statements[sql] = conn.cursor(prepared=True)
+        return prepared
+
+    def object_type(self, cursor, name):
+        cursor.execute("SELECT TABLE_TYPE FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() "
+                       "AND TABLE_NAME = %s", (name,))
+        found = cursor.fetchone()
+        return None if found is None else ("view" if found[0] == "VIEW" else "table")
+
+    def create_view(self, cursor, name, select_sql):
+        cursor.execute(f"CREATE OR REPLACE VIEW {name} AS {select_sql}")
+
+    def create_index(self, cursor, table, column):
+        try:
+            cursor.execute(f"CREATE INDEX idx_{column} ON {table} ({column})")
+        except mysql.connector.Error as e:
+            if e.errno != 1061:  # index already exists
+                raise
+
+    def upsert_sql(self, table, key_columns, value_columns, merge, touch=()):
+        columns = key_columns + value_columns
+        updates = ", ".join([f"{c} = " + self.MERGE_SQL[merge[c]].format(c=c) for c in value_columns] +
+                            [f"{c} = {self.NOW_SQL}" for c in touch])
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+class _SQLiteCursor(sqlite3.Cursor):
+    """Accepts the %s placeholders used throughout the app"""
+
+    def execute(self, sql, params=()):
+        return super().execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, seq_of_params):
+        return super().executemany(sql.replace("%s", "?"), seq_of_params)
+
+
+class _SQLiteConnection(sqlite3.Connection):
+    def cursor(self, factory=_SQLiteCursor, **_):
+        # mysql.connector options such as buffered=False don't apply to SQLite
+        return super().cursor(factory)
+
+    def is_connected(self):
+        return True
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Single-file local store for testing, benchmarking and offline stations. WAL lets the
+    History tab read while a batch writes; synchronous=NORMAL is durable across app crashes
+    and, with one transaction per file, keeps inserts at local-disk speed.
+    """
+    name = "sqlite"
+    MERGE_SQL = {"add": "{c} + excluded.{c}", "min": "min({c}, excluded.{c})", "max": "max({c}, excluded.{c})"}
+    NOW_SQL = "datetime('now', 'localtime')"  # CURRENT_TIMESTAMP is UTC in SQLite; MySQL stores local time
+
+    def __init__(self, path=SQLITE_DB_FILE):
+        super().__init__()
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, factory=_SQLiteConnection, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def column_sql(self, definition):
+        return (definition.replace("INT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+                .replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+                .replace("DEFAULT CURRENT_TIMESTAMP", f"DEFAULT ({self.NOW_SQL})"))
+
+    def object_type(self, cursor, name):
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = %s AND type IN ('table', 'view')", (name,))
+        found = cursor.fetchone()
+        return None if found is None else found[0]
+
+    def create_view(self, cursor, name, select_sql):
+        cursor.execute(f"DROP VIEW IF EXISTS {name}")
+        cursor.execute(f"CREATE VIEW {name} AS {select_sql}")
+
+    def create_index(self, cursor, table, column):
+        # SQLite index names are per database, not per table
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+    def upsert_sql(self, table, key_columns, value_columns, merge, touch=()):
+        columns = key_columns + value_columns
+        updates = ", ".join([f"{c} = " + self.MERGE_SQL[merge[c]].format(c=c) for c in value_columns] +
+                            [f"{c} = {self.NOW_SQL}" for c in touch])
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}")
+
+
+def normalized_view_sql(table):
+    """SELECT giving a migrated table its original columns, order and ids (the peak id)"""
+    date_col = RESULT_TABLES[table]
+    cols = []
+    for definition in TABLE_SCHEMAS[table]:
+        name = definition.split()[0]
+        if name == "id" or name in PEAK_COLUMNS:
+            cols.append(f"p.{name}")
+        elif name == date_col:
+            cols.append(f"i.created_at AS {date_col}")
+        else:
+            cols.append(f"i.{name}")
+    return (f"SELECT {', '.join(cols)} FROM shimadzu_peak p JOIN shimadzu_injection i ON i.id = p.injection_id "
+            f"WHERE i.source_table = '{table}'")
+
+
+def migrate_to_normalized(storage, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+    Copy each flat result table into shimadzu_injection / shimadzu_peak, rename it to
+    <table>_flat and put a compatibility view under its name. Rows get new (peak) ids.
+    Tables already migrated are skipped and a half-finished copy is redone, so the
+    migration can simply be run again after an interruption. Returns {table: rows copied}.
+    """
+    storage.init_normalized_schema()
+    copied = {}
+    for table in RESULT_TABLES:
+        conn = storage.connect()
+        try:
+            cursor = conn.cursor()
+            if storage.object_type(cursor, table) != "table":
+                continue
+            cursor.execute("DELETE FROM shimadzu_peak WHERE injection_id IN "
+                           "(SELECT id FROM shimadzu_injection WHERE source_table = %s)", (table,))
+            cursor.execute("DELETE FROM shimadzu_injection WHERE source_table = %s", (table,))
+            conn.commit()
+
+            columns = [c.split()[0] for c in TABLE_SCHEMAS[table] if c.split()[0] != "id"]
+            last_id, injections, copied[table] = 0, {}, 0
+            while True:
+                cursor.execute(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                               (last_id, chunk_size))
+                found = cursor.fetchall()
+                if not found:
+                    break
+                last_id = found[-1][0]
+                if len(injections) > chunk_size:
+                    injections.clear()
+                storage.insert_normalized(cursor, table, columns, [dict(zip(columns, r[1:])) for r in found],
+                                          injections=injections)
+                conn.commit()
+                copied[table] += len(found)
+                if progress: progress(table, copied[table])
+
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_flat")
+            storage.create_view(cursor, table, normalized_view_sql(table))
+            conn.commit()
+            storage._views[table] = True
+        finally:
+            conn.close()
+    return copied
+
+
+def get_storage():
+    """The backend selected in DB Settings"""
+    backend, path = read_storage_config()
+    return SQLiteBackend(path) if backend == "sqlite" else MySQLBackend()
+
+
+def connect_db():
+    return get_storage().connect()
+
+
+class DBUnavailableError(Exception):
+    """A retryable DB error that persisted through every retry; the run should stop and resume later"""
+
+
+def is_retryable_db_error(exc):
+    if isinstance(exc, sqlite3.OperationalError):
+        return "locked" in str(exc) or "busy" in str(exc)
+    if isinstance(exc, mysql.connector.Error):
+        if exc.errno in RETRYABLE_DB_ERRNOS:
+            return True
+        # Interface/operational errors without an errno are client-side connection failures
+        return exc.errno in (None, -1) and isinstance(exc, (mysql.connector.InterfaceError, mysql.connector.OperationalError))
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def run_with_db_retry(fn, attempts=DB_RETRY_ATTEMPTS, on_retry=None, sleep=time.sleep):
+    """
+    Call fn() (a complete connect/write/commit unit) and retry it on retryable errors,
+    waiting base * 2^n seconds plus jitter. Non-retryable errors are raised straight away;
+    a retryable one that outlasts all attempts is raised as DBUnavailableError.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable_db_error(e):
+                raise
+            if attempt == attempts:
+                METRICS.inc("shimadzu_db_unavailable_total")
+                raise DBUnavailableError(f"{e} (gave up after {attempts} attempts)") from e
+            METRICS.inc("shimadzu_db_retries_total")
+            delay = min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            delay *= random.uniform(0.8, 1.2)
+            if on_retry: on_retry(attempt, delay, e)
+            sleep(delay)
+
+
+def _area_value(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def update_dissolution_summary(storage, cursor, rows):
+    """
+    Fold freshly inserted dissolution rows into shimadzu_dissolution_summary on the caller's
+    cursor (same transaction), then refresh the matched standard mean of every touched
+    u_id/test_code/compound. Statistic rows (Average, %RSD...) and non-numeric areas are skipped.
+    """
+    groups = {}
+    for r in rows:
+        area = _area_value(r.get("area"))
+        if area is None or r.get("title") in SUMMARY_ROW_TITLES:
+            continue
+        key = tuple(r.get(c) or "" for c in DISSOLUTION_SUMMARY_KEY)
+        n, total, sumsq, lo, hi = groups.get(key, (0, 0.0, 0.0, area, area))
+        groups[key] = (n + 1, total + area, sumsq + area * area, min(lo, area), max(hi, area))
+    if not groups:
+        return
+
+    storage.upsert(cursor, "shimadzu_dissolution_summary", DISSOLUTION_SUMMARY_KEY,
+                   ["n", "area_sum", "area_sumsq", "area_min", "area_max"],
+                   [key + stats for key, stats in groups.items()],
+                   {"n": "add", "area_sum": "add", "area_sumsq": "add", "area_min": "min", "area_max": "max"},
+                   touch=["updated_at"])
+
+    placeholders = ", ".join(["%s"] * len(STANDARD_STAGES))
+    for u_id, test_code, compound in sorted({k[:3] for k in groups}):
+        cursor.execute(f"""
+            SELECT stage, SUM(area_sum) / SUM(n) FROM shimadzu_dissolution_summary
+            WHERE u_id = %s AND test_code = %s AND compound_name = %s AND stage IN ({placeholders})
+            GROUP BY stage
+        """, (u_id, test_code, compound, *STANDARD_STAGES))
+        means = dict(cursor.fetchall())
+        std_stage = next((st for st in STANDARD_STAGES if means.get(st) is not None), None)
+        cursor.execute(f"""
+            UPDATE shimadzu_dissolution_summary SET std_stage = %s, std_mean = %s
+            WHERE u_id = %s AND test_code = %s AND compound_name = %s AND stage NOT IN ({placeholders})
+        """, (std_stage, means.get(std_stage), u_id, test_code, compound, *STANDARD_STAGES))
+
+
+def build_result_filters(table, u_id=None, test_code=None, date_from=None, date_to=None, machine_id=None,
+                         sample_id=None, compound=None):
+    """
+    Build a WHERE clause for the result tables. Dates are 'YYYY-MM-DD', date_to is inclusive.
+    sample_id and compound are prefix matches so they can still use an index.
+    """
+    if table not in RESULT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    date_col = RESULT_TABLES[table]
+    clauses, params = [], []
+    if u_id:
+        clauses.append("u_id = %s")
+        params.append(u_id)
+    if test_code:
+        clauses.append("test_code = %s")
+        params.append(test_code)
+    if machine_id:
+        clauses.append("machine_id = %s")
+        params.append(machine_id)
+    if sample_id:
+        clauses.append("sample_id LIKE %s")
+        params.append(sample_id + "%")
+    if compound:
+        clauses.append(f"{COMPOUND_COLUMNS[table]} LIKE %s")
+        params.append(compound + "%")
+    if date_from:
+        clauses.append(f"{date_col} >= %s")
+        params.append(datetime.strptime(date_from, "%Y-%m-%d"))
+    if date_to:
+        clauses.append(f"{date_col} < %s")
+        params.append(datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1))
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+
+def fetch_history_page(conn, table, before_id=None, limit=HISTORY_PAGE_SIZE, **filters):
+    """
+    Keyset-paginated read, newest first: WHERE id < before_id ORDER BY id DESC LIMIT n.
+    Returns (columns, rows); pass the last row's id as before_id to get the next page.
+    """
+    where, params = build_result_filters(table, **filters)
+    if before_id is not None:
+        where += (" AND " if where else " WHERE ") + "id < %s"
+        params.append(before_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {table}{where} ORDER BY id DESC LIMIT %s", params + [limit])
+        rows = cursor.fetchall()
+        return [d[0] for d in cursor.description], rows
+    finally:
+        cursor.close()
+
+
+def stream_export(conn, table, out_path, fmt=None, chunk_size=EXPORT_CHUNK_SIZE, progress=None, **filters):
+    """
+    Stream rows of one result table into a CSV or Parquet file.
+    Rows are pulled through an unbuffered cursor with fetchmany(), so memory
+    stays flat no matter how many rows match. Returns the number of rows written.
+    """
+    fmt = (fmt or os.path.splitext(out_path)[1].lstrip(".") or "csv").lower()
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    where, params = build_result_filters(table, **filters)
+    total = 0
+    cursor = writer = None
+    try:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(f"SELECT * FROM {table}{where} ORDER BY id", params)
+        cols = [d[0] for d in cursor.description]
+        if fmt == "csv":
+            with open(out_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(cols)
+                while True:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    writer.writerows(chunk)
+                    total += len(chunk)
+                    if progress: progress(total)
+        else:
+            # Every column except id is written as text, the tables store strings anyway
+            schema = pa.schema([(c, pa.int64() if c == "id" else pa.string()) for c in cols])
+            writer = pq.ParquetWriter(out_path, schema)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                arrays = []
+                for i, c in enumerate(cols):
+                    if c == "id":
+                        arrays.append(pa.array([r[i] for r in chunk], type=pa.int64()))
+                    else:
+                        arrays.append(pa.array([None if r[i] is None else str(r[i]) for r in chunk], type=pa.string()))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                total += len(chunk)
+                if progress: progress(total)
+    except Exception:
+        # Already failing: an error from close (e.g. unread rows on a dropped connection) must not replace it
+        for obj in (writer if fmt == "parquet" else None, cursor):
+            if obj is not None:
+                try:
+                    obj.close()
+                except Exception:
+                    pass
+        raise
+    if fmt == "parquet":
+        writer.close()
+    cursor.close()
+    return total
+
+class ReportLines(list):
+    """
+    Text lines of a report. In grid mode .tables also holds the peak tables rebuilt from
+    word positions: [{"columns": [...], "rows": [[cell, ...]], "block": compound index}]
+    """
+    tables = ()
+
+
+def _word_lines(words, tolerance=2.0):
+    """Group PyMuPDF words into visual lines: [(y middle, words left to right)] top to bottom"""
+    lines = []
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        mid = (w[1] + w[3]) / 2
+        if lines and mid - lines[-1][0] <= tolerance:
+            lines[-1][1].append(w)
+        else:
+            lines.append((mid, [w]))
+    return [(mid, sorted(ws, key=lambda w: w[0])) for mid, ws in lines]
+
+
+def _match_header(words):
+    """[(label, x0, x1)] of the table header labels found in one visual line"""
+    labels = sorted(TABLE_HEADER_LABELS, key=lambda l: -len(l.split()))
+    found, i = [], 0
+    while i < len(words):
+        for label in labels:
+            n = len(label.split())
+            if " ".join(w[4] for w in words[i:i + n]) == label:
+                found.append((label, words[i][0], words[i + n - 1][2]))
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+
+def _page_tables(words, block):
+    """
+    Rebuild the peak tables of one page. Column bounds sit halfway between neighbouring
+    header labels, every word goes to the column its centre falls in, so a cell keeps all
+    of its words ("betasol Propionate") however the text stream splits them. A line with
+    only text cells and no Title continues the row above (wrapped cell). The row pitch is
+    measured from the header to the first row and between rows; a gap of more than 1.5
+    pitches (a blank row) ends the table, so a continuation line must follow right below.
+    block is the compound index so far; returns (tables, block).
+    """
+    tables, current = [], None
+    for mid, ws in _word_lines(words):
+        if "compound name" in " ".join(w[4] for w in ws).lower():
+            block += 1
+            current = None
+            continue
+        header = _match_header(ws)
+        if len(header) >= 3:
+            bounds = [(header[k][2] + header[k + 1][1]) / 2 for k in range(len(header) - 1)]
+            # Until the first row gives the pitch, allow the header's gap to it to be up to 2.5 line heights
+            current = {"columns": [h[0] for h in header], "bounds": bounds, "rows": [], "block": block,
+                       "last": mid, "pitch": None, "gap": 2.5 * max(w[3] - w[1] for w in ws)}
+            tables.append(current)
+            continue
+        if current is None:
+            continue
+        step = mid - current["last"]
+        if step > current["gap"]:
+            current = None  # blank space: the table ended
+            continue
+        cells = [[] for _ in current["columns"]]
+        for w in ws:
+            cells[bisect.bisect(current["bounds"], (w[0] + w[2]) / 2)].append(w[4])
+        row = [" ".join(c) for c in cells]
+        filled = [current["columns"][k] for k, c in enumerate(row) if c]
+        if current["rows"] and not row[0] and all(label in TABLE_TEXT_LABELS for label in filled):
+            current["rows"][-1] = [" ".join(filter(None, pair)) for pair in zip(current["rows"][-1], row)]
+        else:
+            current["rows"].append(row)
+            # Wrapped cell lines may sit closer together, so only new rows set the pitch
+            current["pitch"] = step if current["pitch"] is None else min(current["pitch"], step)
+            current["gap"] = 1.5 * current["pitch"]
+        current["last"] = mid
+    for table in tables:
+        del table["bounds"], table["last"], table["pitch"], table["gap"]
+    return tables, block
+
+
+def grid_column(tables, label, block=None):
+    """Cells under label in the last matching table (of one compound block), trailing blanks dropped"""
+    for table in reversed(tables or ()):
+        if label in table["columns"] and (block is None or table["block"] == block):
+            k = table["columns"].index(label)
+            column = [row[k] for row in table["rows"]]
+            while column and not column[-1]:
+                column.pop()
+            return column
+    return []
+
+
+def iter_pdf_pages(filepath, grid=False, data=None):
+    """
+    Yield the non-empty, stripped text lines of each page in turn (ReportLines).
+    With grid=True the page's peak tables are also rebuilt from word coordinates.
+    data: the file's bytes when they were already read (read-ahead)
+    """
+    if data is None:
+        with open(filepath, 'rb') as f:
+            data = f.read()
+    block = -1
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        for page in doc:
+            lines = ReportLines(l.strip() for l in page.get_text().splitlines() if l.strip())
+            if grid:
+                lines.tables, block = _page_tables(page.get_text("words"), block)
+            yield lines
+
+
+def iter_pdf_pages_timed(filepath, grid=False, data=None):
+    """iter_pdf_pages() on this thread, recording the extraction time alone (not the parsing in between)"""
+    pages = iter_pdf_pages(filepath, grid, data)
+    seconds = 0.0
+    while True:
+        started = time.perf_counter()
+        page = next(pages, None)
+        seconds += time.perf_counter() - started
+        if page is None:
+            break
+        yield page
+    METRICS.observe("shimadzu_pdf_extract_seconds", seconds)
+
+
+def extract_pdf_lines(filepath, grid=False, data=None, pages=None):
+    """
+    Return the text lines of a whole PDF (module level so it can run in a worker process).
+    pages: stop after this many pages (1 is enough for the report header)
+    """
+    lines, tables = ReportLines(), []
+    for page in itertools.islice(iter_pdf_pages(filepath, grid, data), pages):
+        lines.extend(page)
+        tables.extend(page.tables)
+    lines.tables = tables
+    return lines
+
+
+def extract_pdf_lines_safe(filepath, grid=False, data=None, pages=None):
+    """
+    extract_pdf_lines() for pool.map: returns (lines, error, seconds) instead of raising.
+    Worker processes have their own METRICS, so the time is handed back to the caller.
+    """
+    started = time.perf_counter()
+    try:
+        return extract_pdf_lines(filepath, grid, data, pages), None, time.perf_counter() - started
+    except Exception as e:
+        return None, str(e), time.perf_counter() - started
+
+
+class SourcePdf(str):
+    """
+    Path of the PDF that committed rows came from. .data holds the file's bytes when
+    they were already read ahead, so the sinks don't read the share a second time.
+    """
+    data = None
+
+    def __new__(cls, path, data=None):
+        source = super().__new__(cls, path)
+        source.data = data
+        return source
+
+
+def read_pdf_bytes(filepath):
+    """Read a whole PDF: (data, error, seconds), the seconds being the disk / share read alone"""
+    started = time.perf_counter()
+    try:
+        with open(filepath, 'rb') as f:
+            data, error = f.read(), None
+    except OSError as e:
+        data, error = None, str(e)
+    seconds = time.perf_counter() - started
+    METRICS.observe("shimadzu_pdf_read_seconds", seconds)
+    return data, error, seconds
+
+
+class PdfPrefetcher:
+    """
+    Reads the PDFs of a run ahead on I/O threads while the current one is parsed, so share
+    latency overlaps with parsing instead of adding to every file. At most depth files are
+    in flight or waiting in memory. Iterating yields (path, data, error, read seconds, waited
+    seconds) in file order; waited is how long the parser stalled on the read, near zero
+    unless the share is the slower stage.
+    """
+
+    def __init__(self, files, executor, depth=PREFETCH_DEPTH):
+        self.files = files
+        self.executor = executor
+        self.depth = max(1, depth)
+
+    def __iter__(self):
+        files = iter(self.files)
+        ahead = deque((path, self.executor.submit(read_pdf_bytes, path)) for path in itertools.islice(files, self.depth))
+        try:
+            while ahead:
+                path, future = ahead.popleft()
+                for path_next in itertools.islice(files, 1):
+                    ahead.append((path_next, self.executor.submit(read_pdf_bytes, path_next)))
+                started = time.perf_counter()
+                data, error, seconds = future.result()
+                waited = time.perf_counter() - started
+                METRICS.observe("shimadzu_pdf_read_wait_seconds", waited)
+                yield path, data, error, seconds, waited
+        finally:
+            # Stopped early (cancel): reads that have not started are dropped
+            for _, future in ahead:
+                future.cancel()
+
+
+class MultiCompoundParser:
+    """
+    One-pass parser for multi-compound reports. feed() takes lines as they arrive (a page at
+    a time) and returns the compound blocks that a following "Compound Name" line closed;
+    close() returns the last one. A block's table starts at its first "Title"; each column
+    comes from the last occurrence of its label and runs up to the next column header,
+    skipping ":" continuation lines.
+    Blocks: {"index", "compound_name", "has_table", "columns": {label: [values]}}
+    """
+
+    def __init__(self):
+        self.header = {}   # report header label -> value
+        self.tables = []   # grid tables seen so far (grid mode)
+        self._labels = {label.lower(): label for label in MULTI_COLUMN_LABELS}
+        self._pending = None  # header label waiting for its value line
+        self._block = None
+        self._open = {}  # columns still collecting values
+        self._count = 0
+
+    def feed(self, lines, tables=()):
+        self.tables.extend(tables)
+        done = []
+        for line in lines:
+            if self._pending is not None:
+                self.header[self._pending] = line.lstrip(": ").strip()
+                self._pending = None
+            if line in REPORT_HEADER_LABELS and line not in self.header:
+                self._pending = line
+
+            if "compound name" in line.lower():
+                if self._block is not None:
+                    done.append(self._finish())
+                parts = line.split(":", 1)
+                self._block = {"index": self._count, "compound_name": parts[1].strip() if len(parts) > 1 else "",
+                               "has_table": False, "columns": {}}
+                self._count += 1
+                continue
+            block = self._block
+            if block is None:
+                continue
+            s = line.strip()
+            if not block["has_table"]:
+                if s != "Title":
+                    continue
+                block["has_table"] = True
+
+            for label in list(self._open):
+                if s in MULTI_STOP_HEADERS:
+                    del self._open[label]
+                elif s and not line.startswith(":"):
+                    self._open[label].append(line.lstrip(": ").strip())
+            label = self._labels.get(s.lower())
+            if label:
+                block["columns"][label] = self._open[label] = []
+        return done
+
+    def close(self):
+        return [self._finish()] if self._block is not None else []
+
+    def _finish(self):
+        block, self._block, self._open = self._block, None, {}
+        return block
+
+
+class ParsedReport:
+    """
+    One report parsed in a single pass: header values (first occurrence of each label), the
+    first compound name and every peak table column. A column runs from the last occurrence
+    of its label up to the next table header, skipping ":" lines; grid tables win when present.
+    """
+    _labels = {label.lower(): label for label in TABLE_HEADER_LABELS}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.tables = getattr(lines, "tables", ())
+        self.header = {}
+        self.compound_name = None
+        self.columns = {}
+        pending, column = None, None
+        for line in lines:
+            if pending is not None:
+                self.header[pending] = line.lstrip(": ").strip()
+                pending = None
+            if line in REPORT_HEADER_LABELS and line not in self.header:
+                pending = line
+            if self.compound_name is None and "Compound Name" in line:
+                parts = line.split(":", 1)
+                self.compound_name = parts[1].strip() if len(parts) > 1 else ""
+            label = self._labels.get(line.strip().lower())
+            if label:
+                column = self.columns[label] = []
+            elif column is not None and line.strip() and not line.startswith(":"):
+                column.append(line.lstrip(": ").strip())
+        self.compound_name = self.compound_name or ""
+
+    def value(self, label):
+        """Header value printed after label, '' when missing"""
+        return self.header.get(label, "")
+
+    def column(self, label):
+        return grid_column(self.tables, label) or self.columns.get(label, [])
+
+    def header_fields(self):
+        """Header values keyed by row field (all text)"""
+        return {field: self.value(label) for field, label in REPORT_HEADER_FIELDS.items()}
+
+
+def current_rss_bytes():
+    """Resident set size of this process in bytes (0 if the platform doesn't tell us)"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            get_process = ctypes.windll.kernel32.GetCurrentProcess
+            get_process.restype = wintypes.HANDLE
+            get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+            if get_info(get_process(), ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return 0
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+def count_pdf_pages(paths):
+    pages = 0
+    for path in paths:
+        try:
+            with fitz.open(path) as doc:
+                pages += doc.page_count
+        except Exception:
+            continue  # unreadable files are already reported by the run itself
+    return pages
+
+
+class BatchProfiler:
+    """
+    Deterministic (cProfile) and sampling profile of the calling thread for one run.
+    stop() writes <name>.pstats (pstats / snakeviz) and <name>.collapsed (one
+    "outer;...;inner count" line per stack, for flamegraph.pl or speedscope).
+    Only one cProfile can be active per process (Python 3.12+), so a run started
+    while another one holds it is sampled only and gets no .pstats file.
+    """
+    _deterministic = threading.Lock()  # held by the run whose cProfile is enabled
+
+    def __init__(self, label, interval=PROFILE_SAMPLE_INTERVAL):
+        self.label = label
+        self.interval = interval
+        self.profile = None
+        self.samples = Counter()
+        self.started = datetime.now()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        if self._deterministic.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self.profile = profile
+            except ValueError:  # another profiling tool (debugger, coverage) is active
+                self._deterministic.release()
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self, pdfs=(), rows=0, files=None, directory="."):
+        """
+        Write both files (.collapsed only for a sampled-only run), named with the run's size
+        (files, PDF pages, rows); pages are counted after profiling has stopped. Returns the
+        path without extension.
+        """
+        if self.profile is not None:
+            self.profile.disable()
+            self._deterministic.release()
+        self._stop.set()
+        self._sampler.join()
+        files = len(pdfs) if files is None else files
+        pages = count_pdf_pages(pdfs)
+        name = os.path.join(directory, f"profile_{self.started.strftime('%Y-%m-%d_%H%M%S')}_{self.label}_"
+                                       f"{files}files_{pages}pages_{rows}rows")
+        if self.profile is not None:
+            self.profile.dump_stats(name + ".pstats")
+        with open(name + ".collapsed", "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return name
+
+
+class InlineExecutor:
+    """Executor stand-in that runs each call at submit() on the calling thread, so a profile sees it"""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class BatchResourceTracker:
+    """
+    Samples RSS after every file of a batch and appends one summary line per batch
+    to RESOURCE_LOG_FILE, so long runs can be checked for flat memory.
+    """
+    def __init__(self, label, budget_mb=BATCH_MEMORY_BUDGET_MB):
+        self.label = label
+        self.budget = budget_mb * 1024 * 1024
+        self.files = 0
+        self.rows = 0
+        self.over_budget = False
+        self.started = datetime.now()
+        self.start_rss = self.peak_rss = current_rss_bytes()
+
+    def sample(self, rows=0):
+        """Call once per finished file. Returns True the first time the budget is exceeded."""
+        self.files += 1
+        self.rows += rows
+        rss = current_rss_bytes()
+        if rss > self.budget:
+            gc.collect()
+            rss = current_rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss)
+        if rss > self.budget and not self.over_budget:
+            self.over_budget = True
+            return True
+        return False
+
+    def finish(self):
+        end_rss = current_rss_bytes()
+        self.peak_rss = max(self.peak_rss, end_rss)
+        mb = lambda b: f"{b / (1024 * 1024):.1f}MB"
+        line = (f"[{self.started.strftime('%Y-%m-%d %H:%M:%S')}] {self.label}: files={self.files} rows={self.rows} "
+                f"start_rss={mb(self.start_rss)} peak_rss={mb(self.peak_rss)} end_rss={mb(end_rss)} "
+                f"elapsed={(datetime.now() - self.started).total_seconds():.1f}s")
+        try:
+            with open(RESOURCE_LOG_FILE, "a") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass
+        return line
+
+
+# =========================================================================
+# INGESTION JOBS (progress, ETA, cancel, resume)
+# =========================================================================
+class IngestCheckpoint:
+    """Committed files of the last run per job kind, kept in a JSON file so a stopped run can resume"""
+    def __init__(self, path=INGEST_CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        # Write to a temp file first so a crash never leaves a half-written checkpoint
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def get(self, kind):
+        with self.lock:
+            return self._load().get(kind)
+
+    def save(self, kind, state):
+        with self.lock:
+            data = self._load()
+            data[kind] = state
+            self._write(data)
+
+    def clear(self, kind):
+        with self.lock:
+            data = self._load()
+            if data.pop(kind, None) is not None:
+                self._write(data)
+
+
+class IngestJob:
+    """
+    One Select & Process run: per-file and per-row progress, a rolling
+    throughput-based ETA and a cancel flag checked at file boundaries.
+    Files are recorded in the checkpoint only after their rows are committed.
+    """
+    def __init__(self, kind, tab, files, params, checkpoint=None, done=()):
+        self.kind = kind
+        self.tab = tab
+        self.files = list(files)
+        self.params = params
+        self.checkpoint = checkpoint
+        self.done = set(done)
+        self.skipped = len(self.done)
+        self.processed = 0
+        self.failed = 0
+        self.rows = 0
+        self.current = ""
+        self.cancel_event = threading.Event()
+        self.started = time.monotonic()
+        self.test_code = params.get("test_code", "")  # from the form, read on the Tk thread when the job is created
+        self.durations = deque(maxlen=ETA_WINDOW)
+        self._file_started = None
+        self.read_bytes = 0
+        self.read_seconds = 0.0  # time spent reading PDFs (overlaps parsing when read ahead)
+        self.read_wait = 0.0  # time parsing stalled waiting for a read
+        # Scheduler state
+        self.id = None
+        self.priority = JOB_PRIORITIES.get(kind, 1)
+        self.status = "new"  # queued / running / done / cancelled / failed
+        self.error = None
+        self.ended = None
+        self.profile = False  # profile this run (started on the job's own thread)
+        self.profiler = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def pending_files(self):
+        return [f for f in self.files if f not in self.done]
+
+    def begin_file(self, path):
+        self.current = os.path.basename(path)
+        self._file_started = time.monotonic()
+
+    def add_rows(self, n=1):
+        self.rows += n
+
+    def add_read(self, nbytes, seconds, waited):
+        self.read_bytes += nbytes
+        self.read_seconds += seconds
+        self.read_wait += waited
+
+    def finish_file(self, path, committed=True):
+        self.processed += 1
+        METRICS.inc("shimadzu_files_total", kind=self.kind, status="committed" if committed else "failed")
+        METRICS.set("shimadzu_pending_files", max(0, len(self.files) - self.skipped - self.processed), kind=self.kind)
+        if self._file_started is not None:
+            self.durations.append(time.monotonic() - self._file_started)
+        if committed:
+            self.done.add(path)
+            self._save()
+        else:
+            self.failed += 1
+
+    def _save(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.kind, {
+                "files": self.files, "params": self.params, "done": sorted(self.done),
+                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+
+    def close(self):
+        """Drop the checkpoint once every file is committed; keep it for a later resume otherwise"""
+        METRICS.set("shimadzu_pending_files", 0, kind=self.kind)  # nothing left queued once the run has ended
+        if self.checkpoint is not None and len(self.done) == len(self.files):
+            self.checkpoint.clear(self.kind)
+
+    @property
+    def total(self):
+        return len(self.files) - self.skipped
+
+    def elapsed(self):
+        if self.status in ("new", "queued"):
+            return 0.0
+        return (self.ended or time.monotonic()) - self.started
+
+    def fraction(self):
+        return self.processed / self.total if self.total else 1.0
+
+    def files_per_second(self):
+        spent = sum(self.durations)
+        return len(self.durations) / spent if spent > 0 else 0.0
+
+    def eta_seconds(self):
+        rate = self.files_per_second()
+        return (self.total - self.processed) / rate if rate > 0 else None
+
+    def status_text(self):
+        eta = self.eta_seconds()
+        eta_txt = "--:--" if eta is None else f"{int(eta // 60)}:{int(eta % 60):02d}"
+        text = (f"File {min(self.processed + 1, self.total)}/{self.total} {self.current} | {self.rows} rows | "
+                f"{self.files_per_second():.2f} files/s | ETA {eta_txt}")
+        if self.cancelled:
+            text += " | Cancelling after this file..."
+        return text
+
+
+class JobScheduler:
+    """
+    Prioritized queue of ingestion jobs from every tab, each run on its own worker thread,
+    up to max_running at once. Jobs of the same kind never overlap. The PDF extraction
+    process pool and the DB write slots are shared by all jobs. on_change() is called
+    (from any thread) whenever a job is queued, starts or ends.
+    """
+
+    def __init__(self, max_running=JOB_MAX_RUNNING, db_writers=DB_MAX_WRITERS, on_change=None):
+        self.max_running = max_running
+        self.db_slots = threading.BoundedSemaphore(db_writers)
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.queue = []  # heap of (priority, id, job, fn)
+        self.jobs = []  # every job of this session, in submit order
+        self.running = set()
+        self._ids = itertools.count(1)
+        self._pool = None
+        self._read_pool = None
+
+    def extract_pool(self):
+        """The shared extraction process pool (started on first use)"""
+        with self.lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+            return self._pool
+
+    def read_pool(self):
+        """The shared I/O threads that read PDFs ahead of the parsers"""
+        with self.lock:
+            if self._read_pool is None:
+                self._read_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="pdf-read")
+            return self._read_pool
+
+    def submit(self, job, fn):
+        """Queue fn(job); it runs on a worker thread once a slot is free"""
+        with self.lock:
+            job.id = next(self._ids)
+            job.status = "queued"
+            heapq.heappush(self.queue, (job.priority, job.id, job, fn))
+            self.jobs.append(job)
+        self._changed()
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        starting = []
+        with self.lock:
+            blocked = []
+            while self.queue and len(self.running) < self.max_running:
+                item = heapq.heappop(self.queue)
+                job = item[2]
+                if any(r.kind == job.kind for r in self.running):
+                    blocked.append(item)
+                    continue
+                job.status = "running"
+                job.started = time.monotonic()
+                self.running.add(job)
+                starting.append(item)
+            for item in blocked:
+                heapq.heappush(self.queue, item)
+        for _, _, job, fn in starting:
+            worker = threading.Thread(target=self._run, args=(job, fn), daemon=True, name=f"ingest-job-{job.id}")
+            worker.ingest_job = job  # lets row counting find the job of the current thread
+            worker.start()
+        if starting:
+            self._changed()
+
+    def _run(self, job, fn):
+        try:
+            fn(job)
+            status = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.error = str(e)
+            status = "failed"
+        with self.lock:
+            self.running.discard(job)
+            job.status = status
+            job.ended = time.monotonic()
+        self._changed()
+        self._dispatch()
+
+    def cancel(self, job):
+        """Drop a queued job, or ask a running one to stop after its current file"""
+        with self.lock:
+            queued = [item for item in self.queue if item[2] is job]
+            if queued:
+                self.queue.remove(queued[0])
+                heapq.heapify(self.queue)
+                job.status = "cancelled"
+                job.ended = time.monotonic()
+        job.cancel()
+        self._changed()
+
+    def run_next(self, job):
+        """Move a queued job to the front of the queue"""
+        with self.lock:
+            for i, item in enumerate(self.queue):
+                if item[2] is job:
+                    job.priority = min(q[0] for q in self.queue) - 1
+                    self.queue[i] = (job.priority,) + item[1:]
+                    heapq.heapify(self.queue)
+                    break
+        self._changed()
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def active(self, tab=None):
+        with self.lock:
+            return [j for j in self.jobs if j.status in ("queued", "running") and (tab is None or j.tab == tab)]
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [j for j in self.jobs if j.status in ("queued", "running")]
+        self._changed()
+
+    def shutdown(self):
+        for job in self.active():
+            self.cancel(job)
+        with self.lock:
+            pools = [self._pool, self._read_pool]
+            self._pool = self._read_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)  # waits for at most the files in progress
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+
+# =========================================================================
+# LAYOUT PROFILES (which label variants a report layout uses)
+# =========================================================================
+class LayoutProfiles:
+    """
+    Reports from the same method / report format file share one layout, so the label
+    variant that matched once (e.g. the theoretical plate label) is remembered per method / report
+    format key in a JSON file and tried first next time. Probing all variants only
+    happens for a new layout or when the remembered choice no longer matches.
+    """
+    def __init__(self, path=LAYOUT_PROFILE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(path, "r") as f:
+                self.profiles = json.load(f)
+        except (OSError, ValueError):
+            self.profiles = {}
+
+    def pick(self, key, field, candidates, probe):
+        """
+        Return (choice, result) for the first candidate whose probe(candidate) is truthy,
+        starting with the one remembered for this layout. (None, None) if nothing matches.
+        """
+        with self.lock:
+            known = self.profiles.get(key, {}).get(field) if key else None
+        if known is not None:
+            result = probe(known)
+            if result:
+                METRICS.inc("shimadzu_layout_profile_total", result="hit")
+                return known, result
+        METRICS.inc("shimadzu_layout_profile_total", result="miss")
+        for candidate in candidates:
+            if candidate == known:
+                continue
+            result = probe(candidate)
+            if result:
+                if key:
+                    with self.lock:
+                        self.profiles.setdefault(key, {})[field] = candidate
+                        self.dirty = True
+                return candidate, result
+        return None, None
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # Same temp-file + replace as the ingest checkpoint
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.profiles, f, indent=1)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+
+# =========================================================================
+# BATCH MANIFEST (CSV / Excel)
+# =========================================================================
+def read_manifest(path):
+    """Read a CSV or .xlsx manifest into a list of dicts with canonical keys (plus '_line')"""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("Excel manifests need openpyxl (pip install openpyxl), or save the sheet as CSV")
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet_rows = [["" if v is None else str(v) for v in r] for r in wb.active.iter_rows(values_only=True)]
+        finally:
+            wb.close()
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            sheet_rows = list(csv.reader(f))
+    if not sheet_rows:
+        return []
+
+    keys = [MANIFEST_ALIASES.get(h.strip().lower().replace(" ", "_"), None) for h in sheet_rows[0]]
+    entries = []
+    for line_no, raw in enumerate(sheet_rows[1:], start=2):
+        if not any(v.strip() for v in raw):
+            continue
+        entry = {"_line": line_no}
+        for key, val in zip(keys, raw):
+            if key and val.strip():
+                entry[key] = val.strip()
+        entries.append(entry)
+    return entries
+
+
+def validate_manifest(entries, default_user_id="", default_mode="single"):
+    """
+    Check every manifest row before any PDF is opened.
+    Fills in defaults (user_id, mode, vessel, release type) and returns a list of error strings.
+    """
+    errors = []
+    seen = set()
+    if not entries:
+        return ["Manifest is empty."]
+    for e in entries:
+        where = f"Line {e['_line']}"
+        key = e.get("file") or e.get("data_file")
+        if not key:
+            errors.append(f"{where}: needs a file name or data_file")
+        elif key.lower() in seen:
+            errors.append(f"{where}: duplicate entry for {key}")
+        else:
+            seen.add(key.lower())
+        if not e.get("u_id"):
+            errors.append(f"{where}: u_id is empty")
+        e.setdefault("user_id", default_user_id)
+        if not e["user_id"]:
+            errors.append(f"{where}: user_id is empty (set it in the manifest or the form)")
+
+        stage = e.get("stage", "").upper()
+        if stage:
+            # Dissolution row
+            e["kind"] = "dissolution"
+            if stage not in DISSOLUTION_STAGES:
+                errors.append(f"{where}: unknown stage '{e['stage']}' (expected {', '.join(DISSOLUTION_STAGES)})")
+            e["stage"] = stage
+            e.setdefault("vessel", "" if stage in ("CS", "SS") else stage)
+            e["release_type"] = STAGE_RELEASE_TYPES.get(stage[:1], "") if stage not in ("CS", "SS") else ""
+            e.setdefault("component_type", "single")
+            if e.get("test_code") not in DISSOLUTION_TEST_CODES:
+                errors.append(f"{where}: dissolution test_code must be one of {', '.join(DISSOLUTION_TEST_CODES)}")
+        else:
+            e["kind"] = "assay"
+            e["mode"] = e.get("mode", default_mode).lower()
+            if e["mode"] in ("multi", "multiple"):
+                e["mode"] = "multiple"
+            elif e["mode"] != "single":
+                errors.append(f"{where}: mode must be single or multiple")
+            if e.get("test_code") not in ASSAY_TEST_CODES:
+                errors.append(f"{where}: assay test_code must be between {ASSAY_TEST_CODES[0]} and {ASSAY_TEST_CODES[-1]}")
+    return errors
+
+
+def match_manifest(entries, files):
+    """
+    Map selected PDF paths to manifest rows by file name (extension ignored, so a
+    data_file 'X.lcd' also matches 'X.pdf'). Returns (by_path, pending, ambiguous, missing) where
+    pending holds the remaining data_file-keyed rows, matched against the report header after
+    extraction, ambiguous lists the file names / data files claimed by more than one row and
+    missing the rows naming a PDF that was not selected.
+    """
+    by_stem = {}
+    for e in entries:
+        key = e.get("file") or e.get("data_file")
+        by_stem.setdefault(os.path.splitext(os.path.basename(key))[0].lower(), []).append(e)
+    by_path, ambiguous = {}, []
+    for path in files:
+        found = by_stem.get(os.path.splitext(os.path.basename(path))[0].lower(), [])
+        if len(found) == 1:
+            by_path[path] = found[0]
+        elif found:
+            ambiguous.append(f"{os.path.basename(path)}: matches lines {', '.join(str(e['_line']) for e in found)}")
+    matched = {id(e) for e in by_path.values()}
+    pending, missing = {}, []
+    for e in entries:
+        key = (e.get("data_file") or e.get("file")).lower()
+        if id(e) in matched:
+            continue
+        if key.endswith(".pdf"):
+            missing.append(e)
+            continue
+        if key in pending:
+            ambiguous.append(f"{key}: data_file on lines {pending[key]['_line']} and {e['_line']}")
+        pending[key] = e
+    return by_path, pending, ambiguous, missing
+
+
+def parse_acquired(text):
+    for fmt in ACQUIRED_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def group_sequences(reports, gap_minutes=SEQUENCE_GAP_MINUTES):
+    """
+    Split reports (dicts with "header" and "standard") into acquisition sequences: same
+    Batch File, ordered by Date Acquired / Tray# / Vial#, with a new sequence after a gap
+    of more than gap_minutes. Standards come first within a sequence. A report without a
+    Batch File is a sequence of its own.
+    """
+    def order(rep):
+        header = rep["header"]
+        acquired = parse_acquired(header.get("Date Acquired", "")) or datetime.max
+        tray, vial = header.get("Tray#", ""), header.get("Vial#", "")
+        return acquired, int(tray) if tray.isdigit() else 0, int(vial) if vial.isdigit() else 0
+
+    by_batch, sequences = {}, []
+    for rep in reports:
+        batch_file = rep["header"].get("Batch File")
+        if batch_file:
+            by_batch.setdefault(batch_file, []).append((order(rep), rep))
+        else:
+            sequences.append([(order(rep), rep)])
+
+    gap = timedelta(minutes=gap_minutes)
+    for keyed in by_batch.values():
+        keyed.sort(key=lambda kr: kr[0])
+        current = [keyed[0]]
+        for prev, item in zip(keyed, keyed[1:]):
+            if item[0][0] != datetime.max and prev[0][0] != datetime.max and item[0][0] - prev[0][0] > gap:
+                sequences.append(current)
+                current = []
+            current.append(item)
+        sequences.append(current)
+
+    sequences.sort(key=lambda seq: seq[0][0])
+    # sort() is stable, so acquisition order is kept inside the standards and the samples
+    return [sorted((rep for _, rep in seq), key=lambda rep: not rep["standard"]) for seq in sequences]
+
+
+# =========================================================================
+# LOCAL SQLITE MIRROR (offline reads + full-text search)
+# =========================================================================
+class LocalMirror:
+    """
+    Read-through copy of the result tables in a local SQLite file.
+    Rows are added at insert time (keyed by the central DB id) and pulled
+    incrementally from MySQL with sync(), using the highest synced id per table
+    as the watermark. Ids are allocated at insert but rows appear at commit, so
+    each sync re-reads a window of MIRROR_SYNC_LOOKBACK ids behind it; rows
+    already mirrored are ignored. An FTS5 index covers sample/compound names and files.
+    """
+    FTS_COLUMNS = ["sample_name_header", "sample_name", "compound_name", "data_file", "method_file"]
+    KEY_COLUMNS = ["u_id", "sample_id", "test_code", "machine_id"]
+
+    def __init__(self, path=LOCAL_MIRROR_FILE):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS mirror_rows (
+                    table_name TEXT NOT NULL, remote_id INTEGER NOT NULL,
+                    {', '.join(c + ' TEXT' for c in self.KEY_COLUMNS + self.FTS_COLUMNS)},
+                    created_at TEXT, row_json TEXT NOT NULL,
+                    PRIMARY KEY (table_name, remote_id)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_mirror_u_id ON mirror_rows (u_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_mirror_sample_id ON mirror_rows (sample_id)")
+            self.conn.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS mirror_fts USING fts5(
+                    {', '.join(self.FTS_COLUMNS)}, content='mirror_rows', content_rowid='rowid'
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    table_name TEXT PRIMARY KEY, last_id INTEGER, last_created_at TEXT
+                )
+            """)
+
+    def _add(self, table, remote_id, row, created_at):
+        cols = self.KEY_COLUMNS + self.FTS_COLUMNS
+        vals = [None if row.get(c) is None else str(row.get(c)) for c in cols]
+        cur = self.conn.execute(
+            f"INSERT OR IGNORE INTO mirror_rows (table_name, remote_id, {', '.join(cols)}, created_at, row_json) "
+            f"VALUES (?, ?, {', '.join(['?'] * len(cols))}, ?, ?)",
+            [table, remote_id] + vals + [created_at, json.dumps(row, default=str)])
+        if cur.rowcount == 1:
+            fts_vals = vals[len(self.KEY_COLUMNS):]
+            self.conn.execute(f"INSERT INTO mirror_fts (rowid, {', '.join(self.FTS_COLUMNS)}) "
+                              f"VALUES (?, {', '.join(['?'] * len(self.FTS_COLUMNS))})", [cur.lastrowid] + fts_vals)
+        return cur.rowcount
+
+    def add_rows(self, table, id_rows):
+        """Mirror freshly inserted rows: id_rows is a list of (remote_id, row dict)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            for remote_id, row in id_rows:
+                self._add(table, remote_id, row, now)
+
+    def sync(self, mysql_conn, chunk_size=MIRROR_SYNC_CHUNK, progress=None, lookback=MIRROR_SYNC_LOOKBACK):
+        """Pull rows from lookback ids behind the per-table watermark onwards. Returns rows added."""
+        added = 0
+        for table, date_col in RESULT_TABLES.items():
+            with self.lock:
+                state = self.conn.execute("SELECT last_id FROM sync_state WHERE table_name = ?", (table,)).fetchone()
+            last_id = state[0] if state else 0
+            scan_id = max(0, last_id - lookback)
+            cursor = mysql_conn.cursor()
+            try:
+                while True:
+                    cursor.execute(f"SELECT * FROM {table} WHERE id > %s ORDER BY id LIMIT %s", (scan_id, chunk_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    cols = [d[0] for d in cursor.description]
+                    with self.lock, self.conn:
+                        for r in rows:
+                            row = dict(zip(cols, r))
+                            remote_id = row.pop("id")
+                            created = row.pop(date_col, None)
+                            added += self._add(table, remote_id, row, None if created is None else str(created))
+                            scan_id = remote_id
+                        if scan_id > last_id:
+                            last_id = scan_id
+                            self.conn.execute("INSERT OR REPLACE INTO sync_state (table_name, last_id, last_created_at) "
+                                              "VALUES (?, ?, ?)", (table, last_id, None if created is None else str(created)))
+                    if progress: progress(table, scan_id)
+            finally:
+                cursor.close()
+        return added
+
+    @staticmethod
+    def _fts_query(text):
+        # Every word becomes a quoted prefix term, so user input can't break the MATCH syntax
+        terms = [w.replace('"', '') for w in text.split()]
+        return " ".join(f'"{t}"*' for t in terms if t)
+
+    def query_page(self, table, before_id=None, limit=HISTORY_PAGE_SIZE, u_id=None, sample_id=None,
+                   compound=None, date_from=None, date_to=None, text=None, **_):
+        """Same keyset paging as fetch_history_page(), served from the local file. Returns (columns, rows)."""
+        clauses, params = ["table_name = ?"], [table]
+        if u_id:
+            clauses.append("u_id = ?")
+            params.append(u_id)
+        if sample_id:
+            clauses.append("sample_id LIKE ?")
+            params.append(sample_id + "%")
+        if compound:
+            clauses.append(f"{COMPOUND_COLUMNS[table]} LIKE ?")
+            params.append(compound + "%")
+        if date_from:
+            clauses.append("created_at >= ?")
+            params.append(datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d"))
+        if date_to:
+            clauses.append("created_at < ?")
+            params.append((datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if text and self._fts_query(text):
+            clauses.append("rowid IN (SELECT rowid FROM mirror_fts WHERE mirror_fts MATCH ?)")
+            params.append(self._fts_query(text))
+        if before_id is not None:
+            clauses.append("remote_id < ?")
+            params.append(before_id)
+        with self.lock:
+            found = self.conn.execute(
+                f"SELECT remote_id, created_at, row_json FROM mirror_rows WHERE {' AND '.join(clauses)} "
+                f"ORDER BY remote_id DESC LIMIT ?", params + [limit]).fetchall()
+
+        cols, dicts = ["id"], []
+        for remote_id, created_at, row_json in found:
+            row = json.loads(row_json)
+            row["created_at"] = created_at
+            for c in row:
+                if c not in cols: cols.append(c)
+            dicts.append((remote_id, row))
+        rows = [tuple([remote_id] + [row.get(c) for c in cols[1:]]) for remote_id, row in dicts]
+        return cols, rows
+
+    def reset(self):
+        """Forget every mirrored row and watermark (after the central ids changed)"""
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO mirror_fts (mirror_fts) VALUES ('delete-all')")
+            self.conn.execute("DELETE FROM mirror_rows")
+            self.conn.execute("DELETE FROM sync_state")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# =========================================================================
+# STRUCTURED AUDIT LOG (JSONL + lookup index)
+# =========================================================================
+class AuditLog:
+    """
+    Append-only audit trail: one record per committed file, {"ts", "table", "source", "rows"}.
+    Records go to audit_<date>.jsonl (or .jsonl.gz) and a small SQLite index maps each
+    u_id / sample_id / data_file to the file and byte offset of the records holding it.
+    """
+
+    def __init__(self, directory=".", compress=AUDIT_COMPRESS, index_path=None):
+        self.directory = directory
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.index = sqlite3.connect(index_path or os.path.join(directory, AUDIT_INDEX_FILE), check_same_thread=False)
+        with self.lock, self.index:
+            self.index.execute("PRAGMA journal_mode=WAL")
+            self.index.execute("""
+                CREATE TABLE IF NOT EXISTS audit_index (
+                    key_name TEXT NOT NULL, key_value TEXT NOT NULL,
+                    log_file TEXT NOT NULL, offset INTEGER NOT NULL,
+                    ts TEXT NOT NULL, table_name TEXT NOT NULL
+                )
+            """)
+            self.index.execute("CREATE INDEX IF NOT EXISTS idx_audit_key ON audit_index (key_name, key_value, ts)")
+
+    def _path(self, now):
+        name = f"audit_{now.strftime('%Y-%m-%d')}.jsonl" + (".gz" if self.compress else "")
+        return os.path.join(self.directory, name)
+
+    def write(self, table, source, rows):
+        """Append one record for a committed file's rows and index its keys"""
+        now = datetime.now()
+        ts = now.strftime("%Y-%m-%d %H:%M:%S")
+        line = json.dumps({"ts": ts, "table": table, "source": source, "rows": rows},
+                          default=str, separators=(",", ":")) + "\n"
+        data = line.encode("utf-8")
+        path = self._path(now)
+        keys = {(k, str(r[k])) for r in rows for k in AUDIT_INDEX_KEYS if r.get(k) not in (None, "")}
+        with self.lock:
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(gzip.compress(data) if self.compress else data)
+            with self.index:
+                self.index.executemany(
+                    "INSERT INTO audit_index (key_name, key_value, log_file, offset, ts, table_name) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(k, v, os.path.basename(path), offset, ts, table) for k, v in sorted(keys)])
+
+    def _read_at(self, log_file, offset):
+        path = os.path.join(self.directory, log_file)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            if log_file.endswith(".gz"):
+                # GzipFile reads from the current position: just the member at this offset
+                with gzip.GzipFile(fileobj=f) as gz:
+                    return json.loads(gz.readline())
+            return json.loads(f.readline())
+
+    def lookup(self, u_id=None, sample_id=None, data_file=None, limit=100):
+        """Newest-first audit records containing all of the given keys"""
+        wanted = [(k, v) for k, v in (("u_id", u_id), ("sample_id", sample_id), ("data_file", data_file)) if v]
+        if not wanted:
+            return []
+        sql = " INTERSECT ".join(["SELECT log_file, offset, ts FROM audit_index WHERE key_name = ? AND key_value = ?"] * len(wanted))
+        params = [x for kv in wanted for x in kv]
+        with self.lock:
+            found = self.index.execute(f"SELECT * FROM ({sql}) ORDER BY ts DESC, offset DESC LIMIT ?",
+                                       params + [limit]).fetchall()
+        records = []
+        for log_file, offset, _ in found:
+            try:
+                records.append(self._read_at(log_file, offset))
+            except (OSError, ValueError):
+                continue  # log file moved or truncated; the index entry is stale
+        return records
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+
+
+class ExportSink:
+    """Committed-row sink appending to <directory>/<table>_<date>.csv (header once per file)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, kind, table, id_rows, source=None):
+        if not id_rows:
+            return
+        columns = INSERT_TARGETS[kind][1]
+        path = os.path.join(self.directory, f"{table}_{datetime.now().strftime('%Y-%m-%d')}.csv")
+        with self.lock:
+            new = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(["id"] + columns)
+                writer.writerows([remote_id] + [row.get(c) for c in columns] for remote_id, row in id_rows)
+
+
+# =========================================================================
+# CHROMATOGRAM TRACES (plot polylines rescaled to time / signal)
+# =========================================================================
+def _trace_points(path):
+    """[(x, y)] of a drawing made of connected lines / curves, or None for anything else"""
+    points, breaks = [], 0
+    for item in path["items"]:
+        if item[0] == "l":
+            start, end = item[1], item[2]
+        elif item[0] == "c":
+            start, end = item[1], item[4]  # curves are short in a plot, their end points are enough
+        else:
+            return None
+        if not points or abs(points[-1][0] - start.x) > 0.5 or abs(points[-1][1] - start.y) > 0.5:
+            breaks += 1
+            points.append((start.x, start.y))
+        points.append((end.x, end.y))
+    # Tick marks and grids are many separate segments; a trace is (nearly) one line
+    if len(points) < TRACE_MIN_POINTS or breaks > len(path["items"]) // 10 + 1:
+        return None
+    return points
+
+
+def _axis_fit(ticks):
+    """value = a * position + b fitted to [(position, value)] tick labels; None unless they line up"""
+    values = [v for _, v in ticks]
+    if len(set(values)) < 2:
+        return None
+    n = len(ticks)
+    mean_p = sum(p for p, _ in ticks) / n
+    mean_v = sum(values) / n
+    var = sum((p - mean_p) ** 2 for p, _ in ticks)
+    if var == 0:
+        return None
+    a = sum((p - mean_p) * (v - mean_v) for p, v in ticks) / var
+    b = mean_v - a * mean_p
+    if max(abs(a * p + b - v) for p, v in ticks) > 0.02 * (max(values) - min(values)):
+        return None
+    return a, b
+
+
+def _nearest_group(candidates, key):
+    """The candidates sharing the key value closest to the plot (rounded to 2 pt)"""
+    if not candidates:
+        return []
+    best = min(round(key(c) / 2) for c in candidates)
+    return [c for c in candidates if round(key(c) / 2) == best]
+
+
+def _page_traces(page):
+    """[{"unit", "times", "values"}] for the chromatograms drawn on one page"""
+    numbers = []
+    words = page.get_text("words")
+    for w in words:
+        try:
+            numbers.append((float(w[4].replace(",", "")), w))
+        except ValueError:
+            pass
+    drawings = page.get_drawings()
+    traces = []
+    for path in drawings:
+        points = _trace_points(path)
+        if points is None:
+            continue
+        # The plot frame is the smallest other drawing around the line (the line's own box without one)
+        box = fitz.Rect(path["rect"])
+        frames = [r for r in (fitz.Rect(d["rect"]) for d in drawings if d is not path)
+                  if r.width > 0 and r.height > 0 and (r + (-1, -1, 1, 1)).contains(box)]
+        frame = min(frames, key=lambda r: r.width * r.height) if frames else box
+
+        # Time labels in the first row under the frame, signal labels in the first column left of it
+        below = [(v, w) for v, w in numbers if frame.y1 - 2 <= w[1] <= frame.y1 + TRACE_AXIS_GAP
+                 and frame.x0 - 5 <= (w[0] + w[2]) / 2 <= frame.x1 + 5]
+        left = [(v, w) for v, w in numbers if frame.x0 - TRACE_AXIS_GAP <= w[2] <= frame.x0 + 2
+                and frame.y0 - 5 <= (w[1] + w[3]) / 2 <= frame.y1 + 5]
+        time_fit = _axis_fit([((w[0] + w[2]) / 2, v) for v, w in _nearest_group(below, lambda c: c[1][1])])
+        signal_fit = _axis_fit([((w[1] + w[3]) / 2, v) for v, w in _nearest_group(left, lambda c: -c[1][2])])
+        if time_fit is None or signal_fit is None:
+            continue  # no readable axes: not a chromatogram, or one we cannot scale
+
+        unit = next((w[4] for w in words if w[4] in TRACE_SIGNAL_UNITS
+                     and frame.x0 - 2 * TRACE_AXIS_GAP <= w[0] <= frame.x1
+                     and frame.y0 - 2 * TRACE_AXIS_GAP <= w[1] <= frame.y1), "")
+        (ta, tb), (sa, sb) = time_fit, signal_fit
+        traces.append({"unit": unit,
+                       "times": array.array("f", (ta * x + tb for x, _ in points)),
+                       "values": array.array("f", (sa * y + sb for _, y in points))})
+    return traces
+
+
+def extract_traces(data):
+    """
+    Chromatogram traces of a PDF (bytes): [{"page", "unit", "times", "values"}] with
+    float32 arrays, times in the report's time unit (min) and values in its signal unit.
+    """
+    traces = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for number, page in enumerate(doc):
+            traces.extend(dict(trace, page=number) for trace in _page_traces(page))
+    return traces
+
+
+def _f32_bytes(values):
+    """float32 array as little-endian bytes (the stored format on every platform)"""
+    if sys.byteorder == "big":
+        values = array.array("f", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _f32_array(blob):
+    values = array.array("f")
+    values.frombytes(blob)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+# =========================================================================
+# PDF ARCHIVE (content-addressed, compressed copies of ingested reports)
+# =========================================================================
+class PdfArchive:
+    """
+    Stores each ingested PDF once as <dir>/<hash[:2]>/<sha256>.pdf.zst (.pdf.gz without
+    zstandard). archive_index.db links every hash to the DB rows committed from it, with
+    their u_id and data_file, so a report can be pulled back without the original share.
+    With traces=True the chromatograms of each new PDF are kept in archive_traces as
+    little-endian float32 BLOBs, so they load without opening the PDF.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, traces=False):
+        self.directory = directory
+        self.traces_enabled = traces
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = sqlite3.connect(os.path.join(directory, ARCHIVE_INDEX_FILE), check_same_thread=False)
+        with self.lock, self.index:
+            self.index.execute("PRAGMA journal_mode=WAL")
+            self.index.execute("""
+                CREATE TABLE IF NOT EXISTS archive_files (
+                    sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, stored_size INTEGER NOT NULL,
+                    codec TEXT NOT NULL, archived_at TEXT NOT NULL
+                )
+            """)
+            self.index.execute("""
+                CREATE TABLE IF NOT EXISTS archive_refs (
+                    sha256 TEXT NOT NULL, table_name TEXT NOT NULL, row_ids TEXT NOT NULL,
+                    u_id TEXT, data_file TEXT, source_path TEXT, archived_at TEXT NOT NULL
+                )
+            """)
+            for col in ("sha256", "u_id", "data_file"):
+                self.index.execute(f"CREATE INDEX IF NOT EXISTS idx_archive_{col} ON archive_refs ({col})")
+            self.index.execute("""
+                CREATE TABLE IF NOT EXISTS archive_traces (
+                    sha256 TEXT NOT NULL, page INTEGER NOT NULL, trace INTEGER NOT NULL, unit TEXT,
+                    points INTEGER NOT NULL, times BLOB NOT NULL, signal BLOB NOT NULL,
+                    PRIMARY KEY (sha256, page, trace)
+                )
+            """)
+            # Trace count per archived file, NULL until its traces were extracted (archives made before traces)
+            if "traces" not in [r[1] for r in self.index.execute("PRAGMA table_info(archive_files)")]:
+                self.index.execute("ALTER TABLE archive_files ADD COLUMN traces INTEGER")
+
+    def _path(self, sha256, codec):
+        return os.path.join(self.directory, sha256[:2], f"{sha256}.pdf.{'zst' if codec == 'zstd' else 'gz'}")
+
+    def add(self, source_path, table, id_rows, data=None):
+        """
+        Archive a committed PDF (stored only if its content is new) and link it to its rows.
+        data: the file's bytes when the caller already has them; the file is read otherwise.
+        """
+        if data is None:
+            with open(source_path, "rb") as f:
+                data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        first = id_rows[0][1] if id_rows else {}
+        with self.lock:
+            known = self.index.execute("SELECT traces FROM archive_files WHERE sha256 = ?", (sha256,)).fetchone()
+            if not known:
+                codec = "zstd" if zstandard is not None else "deflate"
+                packed = zstandard.ZstdCompressor(level=10).compress(data) if codec == "zstd" else gzip.compress(data, 6)
+                path = self._path(sha256, codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(packed)
+                os.replace(path + ".tmp", path)
+            with self.index:
+                if not known:
+                    self.index.execute("INSERT INTO archive_files VALUES (?, ?, ?, ?, ?, NULL)",
+                                       (sha256, len(data), len(packed), codec, now))
+                self.index.execute("INSERT INTO archive_refs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (sha256, table, json.dumps([remote_id for remote_id, _ in id_rows]),
+                                    first.get("u_id"), first.get("data_file"), os.path.abspath(source_path), now))
+        if self.traces_enabled and (not known or known[0] is None):
+            self.add_traces(sha256, data)
+        return sha256
+
+    def add_traces(self, sha256, data):
+        """Extract and store the chromatogram traces of an archived PDF (replacing earlier ones); returns the count"""
+        traces = extract_traces(data)
+        counter = {}
+        rows = []
+        for trace in traces:
+            number = counter[trace["page"]] = counter.get(trace["page"], -1) + 1
+            rows.append((sha256, trace["page"], number, trace["unit"], len(trace["times"]),
+                         _f32_bytes(trace["times"]), _f32_bytes(trace["values"])))
+        with self.lock, self.index:
+            self.index.execute("DELETE FROM archive_traces WHERE sha256 = ?", (sha256,))
+            self.index.executemany("INSERT INTO archive_traces VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.index.execute("UPDATE archive_files SET traces = ? WHERE sha256 = ?", (len(rows), sha256))
+        return len(rows)
+
+    def traces(self, sha256):
+        """[{"page", "trace", "unit", "times", "values"}] of an archived PDF, arrays as array('f')"""
+        with self.lock:
+            found = self.index.execute("SELECT page, trace, unit, times, signal FROM archive_traces WHERE sha256 = ? "
+                                       "ORDER BY page, trace", (sha256,)).fetchall()
+        return [{"page": page, "trace": trace, "unit": unit, "times": _f32_array(times), "values": _f32_array(signal)}
+                for page, trace, unit, times, signal in found]
+
+    def without_traces(self):
+        """Hashes of archived PDFs whose traces were never extracted"""
+        with self.lock:
+            return [r[0] for r in self.index.execute("SELECT sha256 FROM archive_files WHERE traces IS NULL")]
+
+    def lookup(self, u_id=None, data_file=None, sha256=None, limit=100):
+        """Newest-first archive references matching all of the given keys"""
+        wanted = [(k, v) for k, v in (("u_id", u_id), ("data_file", data_file), ("r.sha256", sha256)) if v]
+        if not wanted:
+            return []
+        where = " AND ".join(f"{k} = ?" for k, _ in wanted)
+        with self.lock:
+            found = self.index.execute(
+                f"SELECT r.sha256, r.table_name, r.row_ids, r.u_id, r.data_file, r.source_path, r.archived_at, "
+                f"f.size, f.stored_size, f.codec, f.traces FROM archive_refs r JOIN archive_files f ON f.sha256 = r.sha256 "
+                f"WHERE {where} ORDER BY r.archived_at DESC, r.rowid DESC LIMIT ?", [v for _, v in wanted] + [limit]).fetchall()
+        cols = ["sha256", "table", "row_ids", "u_id", "data_file", "source_path", "archived_at", "size", "stored_size",
+                "codec", "traces"]
+        return [dict(zip(cols, r), row_ids=json.loads(r[2])) for r in found]
+
+    def read(self, sha256):
+        """Original PDF bytes for a hash (checked against the hash before they are returned)"""
+        with self.lock:
+            found = self.index.execute("SELECT codec FROM archive_files WHERE sha256 = ?", (sha256,)).fetchone()
+        if found is None:
+            raise KeyError(sha256)
+        with open(self._path(sha256, found[0]), "rb") as f:
+            packed = f.read()
+        data = zstandard.ZstdDecompressor().decompress(packed) if found[0] == "zstd" else gzip.decompress(packed)
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise ValueError(f"archived copy of {sha256} is corrupt")
+        return data
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+
+
+# =========================================================================
+# LOG REPLAY (rebuild missing rows from log_<date>.txt / audit_<date>.jsonl)
+# =========================================================================
+def iter_logged_rows(path):
+    """
+    Stream (table, ts, row) from one log file without loading it. Handles the legacy
+    "Inserted Row (single/multi):" blocks and audit JSONL (plain or .gz).
+    """
+    if ".jsonl" in path:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                for row in rec["rows"]:
+                    row = dict(row)
+                    row.pop("id", None)
+                    yield rec["table"], rec["ts"], row
+        return
+
+    table = ts = None
+    row = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("[") and "] Inserted Row (" in line:
+                if table and row:
+                    yield table, ts, row
+                ts, rest = line[1:].split("] Inserted Row (", 1)
+                table, row = LEGACY_LOG_TABLES.get(rest.split(")", 1)[0]), {}
+            elif line.startswith("    ") and table and ": " in line:
+                col, val = line[4:].split(": ", 1)
+                row[col] = None if val == "None" else val
+            elif not line.strip() and table and row:
+                yield table, ts, row
+                table, row = None, {}
+    if table and row:
+        yield table, ts, row
+
+
+def _replay_chunk(storage, conn, table, items):
+    """Insert the rows of one chunk that are not in the table yet, in one transaction. Returns rows inserted."""
+    date_col = RESULT_TABLES[table]
+    cols = sorted({c for _, row in items for c in row})
+    if not all(c.isidentifier() for c in cols):
+        raise ValueError(f"Unexpected column name in log for {table}")
+    key = lambda row: tuple(None if row.get(c) is None else str(row.get(c)) for c in cols)
+
+    # Dedup against the rows already stored for the same data files
+    files = sorted({row.get("data_file") for _, row in items if row.get("data_file") is not None})
+    clauses = []
+    if files:
+        clauses.append(f"data_file IN ({', '.join(['%s'] * len(files))})")
+    if any(row.get("data_file") is None for _, row in items):
+        clauses.append("data_file IS NULL")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE {' OR '.join(clauses)}", files)
+        existing = {tuple(None if v is None else str(v) for v in r) for r in cursor.fetchall()}
+
+        new_rows = []
+        for ts, row in items:
+            k = key(row)
+            if k not in existing:
+                existing.add(k)  # also drops repeats inside the logs
+                new_rows.append(k + (ts,))
+        if new_rows:
+            storage.bulk_insert(cursor, table, cols + [date_col], new_rows)
+            if table == "shimadzu_dissolution_raw":
+                update_dissolution_summary(storage, cursor, [dict(zip(cols, r)) for r in new_rows])
+        conn.commit()
+        return len(new_rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def replay_logs(storage, paths, chunk_size=REPLAY_CHUNK, progress=None):
+    """
+    Re-insert logged rows missing from the DB, keeping the logged insert time.
+    Rows are buffered per table and loaded chunk by chunk, each chunk in one retried
+    transaction. Returns {"read", "inserted", "seconds"}.
+    """
+    stats = {"read": 0, "inserted": 0, "seconds": 0.0}
+    started = time.perf_counter()
+    pending = {}
+    conn = storage.connect()
+
+    def flush(table):
+        items = pending.pop(table)
+
+        def load():
+            nonlocal conn
+            if not conn.is_connected():
+                conn = storage.connect()
+            return _replay_chunk(storage, conn, table, items)
+        stats["inserted"] += run_with_db_retry(load)
+        stats["seconds"] = time.perf_counter() - started
+        if progress: progress(stats)
+
+    try:
+        for path in paths:
+            for table, ts, row in iter_logged_rows(path):
+                if table not in RESULT_TABLES:
+                    continue
+                stats["read"] += 1
+                pending.setdefault(table, []).append((ts, row))
+                if len(pending[table]) >= chunk_size:
+                    flush(table)
+        for table in list(pending):
+            flush(table)
+    finally:
+        conn.close()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+# =========================================================================
+# REPORT INGESTION (parse reports into rows, write them in retried transactions)
+# =========================================================================
+class ReportIngestor:
+    """
+    Parsing and insert path shared by the app and the load test: turns parsed reports into
+    rows and writes them in retried transactions, bounded by db_slots, then hands the committed
+    rows to the sinks. log takes the status messages (from any thread).
+    """
+
+    def __init__(self, storage, layouts=None, db_slots=None, sinks=(), log=None, sleep=time.sleep):
+        self.storage = storage
+        self.layouts = layouts if layouts is not None else LayoutProfiles()
+        self.db_slots = db_slots if db_slots is not None else threading.BoundedSemaphore(DB_MAX_WRITERS)
+        self.sinks = sinks
+        self.log = log or (lambda msg: None)
+        self.sleep = sleep
+        self.retries = 0
+        self.lock_retries = 0  # retries after a lock wait timeout / deadlock (MySQL) or a busy database (SQLite)
+
+    def db_retry(self, fn, label):
+        """run_with_db_retry() with retries counted and reported through log"""
+        def on_retry(attempt, delay, e):
+            self.retries += 1
+            if getattr(e, "errno", None) in (1205, 1213) or "locked" in str(e) or "busy" in str(e):
+                self.lock_retries += 1
+            self.log(f"DB {label}: {e} - retry {attempt}/{DB_RETRY_ATTEMPTS - 1} in {delay:.1f}s")
+        return run_with_db_retry(fn, on_retry=on_retry, sleep=self.sleep)
+
+    # --------------------- Assay (single) ---------------------
+    def extract_single(self, report, machine_id, sample_id, user_id, test_code, source=None):
+        rows = self.parse_single(report, machine_id, sample_id, user_id, test_code)
+        if rows:
+            if not self.insert_single_db(rows, source):
+                return None
+        else:
+            self.log("No rows extracted for single-compound file.")
+        return len(rows)
+
+    def assay_header(self, fields, machine_id, sample_id, user_id, test_code):
+        """Common assay row values; fields are the report header texts keyed by row field"""
+        return {
+            "machine_id": machine_id, "u_id": sample_id, "user_id": user_id,
+            "test_code": test_code,
+            **fields,
+            "tray": int(fields["tray"] or 0),
+            "vial": int(fields["vial"] or 0),
+            "injection_volume": float(fields["injection_volume"] or 0),
+        }
+
+    def parse_single(self, report, machine_id, sample_id, user_id, test_code):
+        header = self.assay_header(report.header_fields(), machine_id, sample_id, user_id, test_code)
+        titles = report.column("Title")
+        sample_names = report.column("Sample Name")
+        sample_ids = report.column("Sample ID")
+        ret_times = report.column("Ret. Time")
+        areas = report.column("Area")
+        tailing_factors = report.column("Tailing Factor")
+        key = f"{header['method_file']}|{header['report_format_file']}"
+        _, plates = self.layouts.pick(key, "plate_label", PLATE_LABELS, report.column)
+        plates = plates or []
+
+        rows = []
+        row_count = max(len(titles), len(ret_times))
+        for i in range(row_count):
+            try:
+                row = {
+                    **header,
+                    "title": titles[i] if i < len(titles) else None,
+                    "sample_name": sample_names[i] if i < len(sample_names) else None,
+                    "sample_id_ind": sample_ids[i] if i < len(sample_ids) else None,
+                    "ret_time": float(ret_times[i]) if i < len(ret_times) and ret_times[i] else None,
+                    "area": float(areas[i]) if i < len(areas) and areas[i] else None,
+                    "tailing_factor": float(tailing_factors[i]) if i < len(tailing_factors) and tailing_factors[i] else None,
+                    "theoretical_plate": float(plates[i]) if i < len(plates) and plates[i] else None
+                }
+                rows.append(row)
+            except Exception as e:
+                self.log(f"Row {i + 1} skipped: {e}")
+        return rows
+
+    def insert_single_db(self, rows, source=None):
+        try:
+            # Whole file in one transaction: a retry after a dropped connection starts from scratch
+            self.write_parts([("single", rows, source)])
+        except DBUnavailableError:
+            raise
+        except Exception as e:
+            self.log(f"DB error (single): {e}")
+            return False
+        self.log(f"Inserted {len(rows)} rows into shimadzu_lc2050_results.")
+        return True
+
+    # --------------------- Assay Multi ---------------------
+    def extract_multiple(self, pages, machine_id, sample_id, user_id, test_code, source=None):
+        """pages: line lists in document order (one per page, or a single list for the whole report)"""
+        rows_all = []
+        for rows in self.iter_multiple_rows(pages, machine_id, sample_id, user_id, test_code):
+            rows_all.extend(rows)
+        if rows_all and not self.insert_multi_db(rows_all, source):
+            return None
+        return len(rows_all)
+
+    def parse_multiple(self, lines, machine_id, sample_id, user_id, test_code):
+        return [r for rows in self.iter_multiple_rows([lines], machine_id, sample_id, user_id, test_code) for r in rows]
+
+    def iter_multiple_rows(self, pages, machine_id, sample_id, user_id, test_code):
+        """Yield the rows of each compound block as soon as the parser closes it"""
+        parser = MultiCompoundParser()
+        found = False
+        for page in pages:
+            for block in parser.feed(page, getattr(page, "tables", ())):
+                found = True
+                yield self._compound_rows(parser, block, machine_id, sample_id, user_id, test_code)
+        for block in parser.close():
+            found = True
+            yield self._compound_rows(parser, block, machine_id, sample_id, user_id, test_code)
+        if not found:
+            self.log("No compound headers found.")
+
+    def _compound_rows(self, parser, block, machine_id, sample_id, user_id, test_code):
+        def parse_float(val):
+            try:
+                return float(val)
+            except:
+                return None
+
+        if not block["has_table"]:
+            return []
+        fields = {field: parser.header.get(label, "") for field, label in REPORT_HEADER_FIELDS.items()}
+        header_common = self.assay_header(fields, machine_id, sample_id, user_id, test_code)
+
+        def section(label):
+            return grid_column(parser.tables, label, block["index"]) or block["columns"].get(label, [])
+        titles = section("Title")
+        sample_names = section("Sample Name")
+        sample_ids = section("Sample ID")
+        ret_times = section("Ret. Time")
+        areas = section("Area")
+        tailing_factors = section("Tailing Factor")
+        key = f"{header_common['method_file']}|{header_common['report_format_file']}"
+        _, plates = self.layouts.pick(key, "plate_label", PLATE_LABELS, section)
+        plates = plates or []
+
+        rows = []
+        row_count = max(len(titles), len(ret_times), len(areas), len(sample_ids), len(sample_names))
+        for i in range(row_count):
+            rows.append({
+                **header_common,
+                "compound_name": block["compound_name"] or "",
+                "title": titles[i] if i < len(titles) else None,
+                "sample_name": sample_names[i] if i < len(sample_names) else None,
+                "sample_id_ind": sample_ids[i] if i < len(sample_ids) else None,
+                "ret_time": parse_float(ret_times[i]) if i < len(ret_times) else None,
+                "area": parse_float(areas[i]) if i < len(areas) else None,
+                "tailing_factor": parse_float(tailing_factors[i]) if i < len(tailing_factors) else None,
+                "theoretical_plate": parse_float(plates[i]) if i < len(plates) else None
+            })
+        return rows
+
+    def insert_multi_db(self, rows, source=None):
+        try:
+            # Whole file in one transaction: a retry after a dropped connection starts from scratch
+            self.write_parts([("multi", rows, source)])
+        except DBUnavailableError:
+            raise
+        except Exception as e:
+            self.log(f"DB error (multi): {e}")
+            return False
+        self.log(f"Inserted {len(rows)} rows into shimadzu_lc2050_multicomponent.")
+        return True
+
+    # --------------------- Dissolution ---------------------
+    def build_dissolution_rows(self, report, fields, skip_summary_rows):
+        """Turn one parsed dissolution report into rows; fields holds the u_id/stage/etc. values from the UI or manifest"""
+        header = {**report.header_fields(), "compound_name": report.compound_name, **fields}
+        get_col = report.column
+
+        titles = get_col("Title")
+        ret_times = get_col("Ret. Time")
+        areas = get_col("Area")
+        heights = get_col("Height") 
+        tailing = get_col("Tailing Factor")
+        _, plates = self.layouts.pick(f"{header['method_file']}|{header['report_format_file']}", "plate_label",
+                                      PLATE_LABELS, get_col)
+        plates = plates or []
+        
+        pdf_sample_names_col = get_col("Sample Name")
+        pdf_sample_ids_col = get_col("Sample ID")
+
+        rows = []
+        for i in range(max(len(titles), len(ret_times))):
+            t = titles[i] if i < len(titles) else ""
+            
+            # Skip average rows for non-standard files
+            if skip_summary_rows and t in SUMMARY_ROW_TITLES: 
+                continue
+            
+            row = header.copy()
+            row["title"] = t
+            row["ret_time"] = ret_times[i] if i < len(ret_times) else ""
+            row["area"] = areas[i] if i < len(areas) else ""
+            row["height"] = heights[i] if i < len(heights) else "" 
+            row["tailing_factor"] = tailing[i] if i < len(tailing) else ""
+            row["theoretical_plate"] = plates[i] if i < len(plates) else "" 
+            row["sample_name"] = pdf_sample_names_col[i] if i < len(pdf_sample_names_col) else ""
+            row["sample_id_ind"] = pdf_sample_ids_col[i] if i < len(pdf_sample_ids_col) else ""
+            
+            rows.append(row)
+        return rows
+
+    def write_dissolution_rows(self, rows, source=None):
+        """Insert one file's rows in a single retried transaction and mirror them once committed"""
+        return self.write_parts([("dissolution", rows, source)])[0]
+
+    def write_parts(self, parts):
+        """
+        Insert [(kind, rows, source PDF or None)] (kind from INSERT_TARGETS) in one retried
+        transaction, together with the dissolution summary update. The sinks (preview, audit
+        log, mirror, archive...) only see committed rows. Returns the [(id, row)] list of each part.
+        """
+        def write(cursor):
+            inserted = []
+            for kind, rows, _ in parts:
+                table, columns, default = INSERT_TARGETS[kind]
+                inserted.append(self.storage.insert_rows(cursor, table, columns, rows, default))
+            dissolution = [r for kind, rows, _ in parts if kind == "dissolution" for r in rows]
+            if dissolution:
+                # Standards are in the same list, so the matched standard is resolved once
+                update_dissolution_summary(self.storage, cursor, dissolution)
+            return inserted
+
+        def attempt():
+            # Jobs share a few write slots; the others wait here instead of piling up lock waits in the DB
+            with self.db_slots:
+                return self.storage.transaction(write)
+
+        inserted = self.db_retry(attempt, "/".join(sorted({k for k, _, _ in parts})))
+        for (kind, _, source), id_rows in zip(parts, inserted):
+            table = INSERT_TARGETS[kind][0]
+            for sink in self.sinks:
+                # The rows are committed; a failing sink must not fail the file
+                try:
+                    sink(kind, table, id_rows, source)
+                except Exception as e:
+                    self.log(f"Sink error ({table}): {e}")
+        return inserted
+
+
 class ShimadzuPDFApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -26,16 +2874,71 @@ class ShimadzuPDFApp(ctk.CTk):
 
         self.tab_general = self.tabview.add("Assay")
         self.tab_disso = self.tabview.add("Dissolution")
+        self.tab_history = self.tabview.add("History")
+        self.tab_jobs = self.tabview.add("Jobs")
 
         # --- Tab 1 Variables ---
         self.mode_var = ctk.StringVar(value="single")
+        self.sequence_var = ctk.BooleanVar(value=False)  # batch: one transaction per acquisition sequence
+        self.grid_var = ctk.BooleanVar(value=False)  # rebuild peak tables from word positions
+
+        # --- Ingestion jobs (queued from every tab, several run at once) ---
+        self.checkpoint = IngestCheckpoint()
+        self.profile_next_var = ctk.BooleanVar(value=False)
+        self.profile_always = False  # --profile: every run of this session
+        self.layouts = LayoutProfiles()
+        self.scheduler = JobScheduler(on_change=self._jobs_changed)
+        self.db_slots = self.scheduler.db_slots  # bounds concurrent write transactions
+        self.job_bars = {}
+        self._jobs_tick = False
+
+        # --- Metrics exporter (only when configured in the environment) ---
+        try:
+            exporting = start_metrics_from_env()
+            if exporting:
+                print(f"Metrics: {exporting}")
+        except (OSError, ValueError) as e:
+            print(f"Metrics disabled: {e}")
+
+        # --- Local SQLite mirror (offline search); the app works without it ---
+        try:
+            self.mirror = LocalMirror()
+        except Exception as e:
+            self.mirror = None
+            print(f"Local mirror disabled: {e}")
+        try:
+            self.audit = AuditLog()
+        except Exception as e:
+            self.audit = None
+            print(f"Audit log disabled: {e}")
+
+        try:
+            self.archive = PdfArchive(traces=os.environ.get(TRACES_ENV, "").strip() not in ("", "0"))
+        except Exception as e:
+            self.archive = None
+            print(f"PDF archive disabled: {e}")
+
+        # --- Committed-row sinks, called in order after every commit ---
+        self.sinks = [self._count_rows, self._preview_rows, self.audit_rows, self.mirror_rows, self.archive_pdf]
+        export_dir = os.environ.get(EXPORT_DIR_ENV, "").strip()
+        if export_dir:
+            try:
+                self.sinks.append(ExportSink(export_dir))
+            except OSError as e:
+                print(f"CSV export sink disabled: {e}")
+        self.ingestor = ReportIngestor(None, self.layouts, self.db_slots, self.sinks, log=self.log_status,
+                                       sleep=self._ui_sleep)
 
         # --- Initialize Tabs ---
         self.create_main_interface()      # Tab 1 UI (Assay)
         self.setup_dissolution_tab()      # Tab 2 UI (Dissolution)
+        self.setup_history_tab()          # Tab 3 UI (History)
+        self.setup_jobs_tab()             # Tab 4 UI (Jobs)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.load_config() 
         self.init_db_tables() 
+        self.sync_mirror()
 
         # --- Tab Animation Tracker ---
         self.current_tab_name_tracker = "Assay"
@@ -74,8 +2977,7 @@ class ShimadzuPDFApp(ctk.CTk):
         self.machine_id_entry.grid(row=1, column=0, sticky="ew", padx=10, pady=(0, 10))
 
         # Test Code Dropdown for Assay (10003 - 10026)
-        assay_test_codes = [str(i) for i in range(10003, 10027)] 
-        self.test_code_entry = ctk.CTkOptionMenu(input_frame, height=30, values=assay_test_codes)
+        self.test_code_entry = ctk.CTkOptionMenu(input_frame, height=30, values=ASSAY_TEST_CODES)
         self.test_code_entry.set("10013") 
         self.test_code_entry.grid(row=1, column=1, sticky="ew", padx=10, pady=(0, 10))
 
@@ -91,7 +2993,11 @@ class ShimadzuPDFApp(ctk.CTk):
 
         ctk.CTkButton(btn_frame, text="Save Config", command=self.save_config, fg_color="#3B8ED0", width=100).pack(side="left", padx=(0, 5))
         ctk.CTkButton(btn_frame, text="DB Settings", command=self.open_db_config, fg_color="#607D8B", width=100).pack(side="left", padx=5)
-        
+        ctk.CTkButton(btn_frame, text="Export", command=self.open_export_dialog, fg_color="#8E24AA", width=100).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Batch (Manifest)", command=self.process_manifest_batch, fg_color="#00897B", width=120).pack(side="left", padx=5)
+        ctk.CTkCheckBox(btn_frame, text="By sequence", variable=self.sequence_var, width=100).pack(side="left", padx=5)
+        ctk.CTkCheckBox(btn_frame, text="Grid tables", variable=self.grid_var, width=100).pack(side="left", padx=5)
+
         ctk.CTkButton(btn_frame, text="Select & Process", command=self.select_pdfs, 
                       fg_color="#2CC985", hover_color="#229A65", font=("Arial", 13, "bold"), height=35).pack(side="left", padx=20, fill="x", expand=True)
         
@@ -103,6 +3009,7 @@ class ShimadzuPDFApp(ctk.CTk):
         ctk.CTkLabel(log_frame, text="Status Log:", font=("Arial", 11, "bold")).pack(anchor="w", padx=5)
         self.status_box = ctk.CTkTextbox(log_frame, height=60, font=("Consolas", 11))
         self.status_box.pack(fill="x", padx=5, pady=(0,5))
+        self._build_job_bar(log_frame, "Assay")
 
         tree_label = ctk.CTkLabel(main_frame, text="Extracted Data Preview:", font=("Arial", 12, "bold"))
         tree_label.pack(anchor="w", pady=(5, 0))
@@ -172,7 +3079,7 @@ class ShimadzuPDFApp(ctk.CTk):
         self.disso_machine_id_entry = ctk.CTkEntry(info_frame, state="disabled", height=30)
         self.disso_machine_id_entry.grid(row=1, column=0, sticky="ew", padx=5, pady=(0, 10))
 
-        self.disso_test_code = ctk.CTkOptionMenu(info_frame, height=30, values=["10010", "10011"])
+        self.disso_test_code = ctk.CTkOptionMenu(info_frame, height=30, values=DISSOLUTION_TEST_CODES)
         self.disso_test_code.grid(row=1, column=1, sticky="ew", padx=5, pady=(0, 10))
 
         self.disso_sample_id = ctk.CTkEntry(info_frame, height=30, placeholder_text="Scan Sample ID")
@@ -260,6 +3167,12 @@ class ShimadzuPDFApp(ctk.CTk):
         ctk.CTkButton(action_frame, text="Select & Process", command=self.process_dissolution_pdf, 
                       height=35, fg_color="#2CC985", hover_color="#229A65", font=("Arial", 13, "bold")).pack(side="left", fill="x", expand=True, padx=10)
 
+        # Batch (Manifest) Button - same batch mode as the Assay tab
+        ctk.CTkButton(action_frame, text="Batch (Manifest)", command=self.process_manifest_batch,
+                      height=35, fg_color="#00897B", font=("Arial", 11, "bold"), width=140).pack(side="left", padx=(10, 5))
+        ctk.CTkCheckBox(action_frame, text="By sequence", variable=self.sequence_var, width=100).pack(side="left", padx=5)
+        ctk.CTkCheckBox(action_frame, text="Grid tables", variable=self.grid_var, width=100).pack(side="left", padx=(5, 50))
+
         # --- 6. Log (Resized to match Assay) ---
         log_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
         log_frame.pack(fill="x", pady=5)
@@ -267,6 +3180,7 @@ class ShimadzuPDFApp(ctk.CTk):
         ctk.CTkLabel(log_frame, text="Processing Log:", font=("Arial", 11, "bold")).pack(anchor="w", padx=5)
         self.disso_log = ctk.CTkTextbox(log_frame, height=60, font=("Consolas", 11)) 
         self.disso_log.pack(fill="x", padx=5, pady=(0,5))
+        self._build_job_bar(log_frame, "Dissolution")
 
         # --- 7. Extracted Data Preview (Expanded to match Assay) ---
         diss_tree_label = ctk.CTkLabel(main_frame, text="Extracted Data Preview:", font=("Arial", 12, "bold"))
@@ -347,61 +3261,71 @@ class ShimadzuPDFApp(ctk.CTk):
         messagebox.showinfo("Form Cleared", "Dissolution form has been cleared. You can now enter new data.")
 
     def init_db_tables(self):
-        """Ensure all tables (Tab 1 & Tab 2) exist"""
+        """Ensure all tables (Tab 1 & Tab 2) exist on the selected storage backend"""
+        if getattr(self, "storage", None) is not None:
+            self.storage.close()  # settings changed: drop the pooled connections of the old backend
+        self.storage = self.ingestor.storage = get_storage()
         try:
             if os.path.exists(DB_CONFIG_FILE):
-                with open(DB_CONFIG_FILE, "r") as f:
-                    host, port, user, pwd, db = f.read().splitlines()
-                conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS shimadzu_lc2050_results (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        machine_id VARCHAR(50), u_id VARCHAR(100), user_id VARCHAR(100), test_code VARCHAR(100), acquired_by VARCHAR(100),
-                        sample_name_header VARCHAR(100), sample_id VARCHAR(100), tray VARCHAR(50), vial VARCHAR(50),
-                        injection_volume VARCHAR(50), data_file VARCHAR(255), method_file VARCHAR(255), batch_file VARCHAR(255),
-                        report_format_file VARCHAR(255), date_acquired VARCHAR(100), date_processed VARCHAR(100),
-                        title VARCHAR(150), sample_name VARCHAR(150), sample_id_ind VARCHAR(150),
-                        ret_time VARCHAR(50), area VARCHAR(50), tailing_factor VARCHAR(50), theoretical_plate VARCHAR(50),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS shimadzu_lc2050_multicom_raw (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        machine_id VARCHAR(50), u_id VARCHAR(100), user_id VARCHAR(100), test_code VARCHAR(100),
-                        acquired_by VARCHAR(100), sample_name_header VARCHAR(100), sample_id VARCHAR(100), tray VARCHAR(50),
-                        vial VARCHAR(50), injection_volume VARCHAR(50), data_file VARCHAR(255), method_file VARCHAR(255),
-                        batch_file VARCHAR(255), report_format_file VARCHAR(255), date_acquired VARCHAR(100), date_processed VARCHAR(100),
-                        compound_name VARCHAR(150), title VARCHAR(150), sample_name VARCHAR(150), sample_id_ind VARCHAR(150),
-                        ret_time VARCHAR(50), area VARCHAR(50), tailing_factor VARCHAR(50), theoretical_plate VARCHAR(50),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS shimadzu_dissolution_raw (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        machine_id VARCHAR(50), u_id VARCHAR(100), user_id VARCHAR(100), test_code VARCHAR(100),
-                        acquired_by VARCHAR(100), sample_name_header VARCHAR(100), sample_id VARCHAR(100), 
-                        tray VARCHAR(50), vial VARCHAR(50), injection_volume VARCHAR(50),
-                        data_file VARCHAR(255), method_file VARCHAR(255), batch_file VARCHAR(255),
-                        report_format_file VARCHAR(255), date_acquired VARCHAR(100), date_processed VARCHAR(100),
-                        compound_name VARCHAR(150), title VARCHAR(150), sample_name VARCHAR(150), sample_id_ind VARCHAR(150),
-                        ret_time VARCHAR(50), area VARCHAR(50), height VARCHAR(50), tailing_factor VARCHAR(50), theoretical_plate VARCHAR(50),
-                        
-                        component_type VARCHAR(50), process_type VARCHAR(50), medium_name VARCHAR(100),
-                        stage VARCHAR(20), vessel_id VARCHAR(20),
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
-                conn.close()
+                self.storage.init_schema()
         except Exception as e:
             self.log_status(f"DB Init Error: {e}")
 
+    def _ui_sleep(self, seconds):
+        if threading.current_thread() is not threading.main_thread():
+            time.sleep(seconds)  # job threads just wait, the UI stays responsive anyway
+            return
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            self.update()
+            time.sleep(0.05)
+
+    def mirror_rows(self, kind, table, id_rows, source=None):
+        """Copy committed rows into the local mirror; a mirror failure never fails the insert"""
+        if self.mirror is None or not id_rows:
+            return
+        try:
+            self.mirror.add_rows(table, id_rows)
+        except Exception as e:
+            self.log_status(f"Local mirror error: {e}")
+
+    def audit_rows(self, kind, table, id_rows, source=None):
+        """Append committed rows (list of (id, row dict)) to the structured audit log"""
+        if self.audit is None or not id_rows:
+            return
+        try:
+            self.audit.write(table, kind, [dict(row, id=remote_id) for remote_id, row in id_rows])
+        except (OSError, sqlite3.Error) as e:
+            self.log_status(f"Audit log error: {e}")
+
+    def archive_pdf(self, kind, table, id_rows, source=None):
+        """Keep a content-addressed copy of the PDF the committed rows came from"""
+        if self.archive is None or source is None or not id_rows:
+            return
+        try:
+            self.archive.add(source, table, id_rows, getattr(source, "data", None))
+        except (OSError, sqlite3.Error) as e:
+            self.log_status(f"PDF archive error: {e}")
+
+    def sync_mirror(self):
+        """Pull rows from the central DB into the local mirror (background thread)"""
+        if self.mirror is None or not os.path.exists(DB_CONFIG_FILE):
+            return
+
+        def worker():
+            conn = None
+            try:
+                conn = connect_db()
+                added = self.mirror.sync(conn)
+                self.after(0, self.log_status, f"Local mirror synced ({added} new rows).")
+            except Exception as e:
+                self.after(0, self.log_status, f"Local mirror sync skipped: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+
+        threading.Thread(target=worker, daemon=True).start()
+
     # =========================================================================
     # TAB 1 ACTION: ASSAY EXTRACTION
     # =========================================================================
@@ -419,29 +3343,90 @@ class ShimadzuPDFApp(ctk.CTk):
                 messagebox.showwarning("Input Required", "Enter both sample ID (u_id) and User ID.")
                 return
 
-            import fitz
+            mode = self.mode_var.get()
+            job = self._start_job("assay", files, {"mode": mode, "u_id": sample_id,
+                                                   "user_id": user_id, "test_code": test_code})
             self.log_status(f"PyMuPDF version: {fitz.__doc__}")
-
-            for filepath in files:
+            # Everything the job needs from the form is read here, the job runs on its own thread
+            settings = {"mode": mode, "machine_id": self.machine_id_entry.get().strip(), "sample_id": sample_id,
+                        "user_id": user_id, "grid": self.grid_var.get()}
+            self._submit_job(job, lambda job: self._run_assay(job, **settings))
+
+    def _run_assay(self, job, mode, machine_id, sample_id, user_id, grid):
+        test_code = job.test_code
+        tracker = BatchResourceTracker(f"Assay ({mode})")
+        reads = self._read_ahead(job)
+        try:
+            for filepath, data, read_error, read_text in reads:
+                # Cancel is honoured between files; everything before this point is committed
+                if job.cancelled:
+                    break
+                job.begin_file(filepath)
                 filename = os.path.basename(filepath)
-                self.log_status(f"Processing: {filename}")
+                self.log_status(f"Processing: {filename} ({read_text})")
+                inserted = 0
                 try:
-                    with open(filepath, 'rb') as f:
-                        data = f.read()
-                        doc = fitz.open(stream=data, filetype='pdf')
-                        lines = [line.strip() for page in doc for line in page.get_text().splitlines() if line.strip()]
-
+                    if read_error:
+                        raise OSError(read_error)
+                    if mode == "single":
+                        # Document is opened and closed in the shared extraction pool, only the text lines come back
+                        lines = self._extract(filepath, grid, data)
                         self.log_status(f"Extracted {len(lines)} lines")
-
                         if len(lines) > 0:
-                            if self.mode_var.get() == "single":
-                                self.extract_single(lines, self.machine_id_entry.get().strip(), sample_id, user_id)
-                            else:
-                                self.extract_multiple(lines, self.machine_id_entry.get().strip(), sample_id, user_id)
+                            inserted = self.ingestor.extract_single(ParsedReport(lines), machine_id, sample_id,
+                                                                    user_id, test_code, source=SourcePdf(filepath, data))
                         else:
                             self.log_status(f"No text extracted (image PDF?)")
+                    else:
+                        # Pages go straight into the streaming parser, compound blocks close as they are read
+                        inserted = self.ingestor.extract_multiple(iter_pdf_pages_timed(filepath, grid, data),
+                                                                  machine_id, sample_id, user_id, test_code,
+                                                                  source=SourcePdf(filepath, data))
+                except DBUnavailableError as e:
+                    # Stop here; committed files stay in the checkpoint so a rerun resumes after them
+                    self.log_status(f"Database unavailable: {e}. Select the same files again to resume.")
+                    job.finish_file(filepath, committed=False)
+                    break
                 except Exception as e:
                     self.log_status(f"Error: {e}")
+                    inserted = None
+                job.finish_file(filepath, committed=inserted is not None)
+                if tracker.sample(inserted or 0):
+                    self.log_status(f"Warning: memory above {BATCH_MEMORY_BUDGET_MB} MB budget")
+                self._job_progress(job)
+        finally:
+            reads.close()
+            self.log_status(self._end_job(job))
+
+        self.log_status(tracker.finish())
+
+    def _read_ahead(self, job, files=None):
+        """
+        Iterate (path, data, error, timing text) over files (default: the job's pending files),
+        read ahead on the shared I/O threads. Read and stall times are added to the job.
+        """
+        files = job.pending_files() if files is None else files
+        for path, data, error, seconds, waited in PdfPrefetcher(files, self.scheduler.read_pool()):
+            job.add_read(len(data or b""), seconds, waited)
+            yield path, data, error, f"read {seconds:.2f}s, waited {waited:.2f}s"
+
+    def _extract_pool(self):
+        """
+        The shared extraction pool, or in-process extraction while the current job is profiled:
+        work done in the worker processes would not show up in its profile
+        """
+        job = getattr(threading.current_thread(), "ingest_job", None)
+        if job is not None and job.profiler is not None:
+            return InlineExecutor()
+        return self.scheduler.extract_pool()
+
+    def _extract(self, filepath, grid=False, data=None):
+        """extract_pdf_lines() in the shared extraction pool"""
+        lines, error, seconds = self._extract_pool().submit(extract_pdf_lines_safe, filepath, grid, data).result()
+        METRICS.observe("shimadzu_pdf_extract_seconds", seconds)
+        if error:
+            raise RuntimeError(error)
+        return lines
 
     # --------------------- Helpers (Assay) ---------------------
     def save_test_code(self, code):
@@ -489,7 +3474,7 @@ class ShimadzuPDFApp(ctk.CTk):
     def open_db_config(self):
         win = ctk.CTkToplevel(self)
         win.title("DB Config")
-        win.geometry("400x400")
+        win.geometry("400x540")
         entries = {}
         labels = ["Host", "Port", "User", "Password", "Database"]
 
@@ -504,269 +3489,74 @@ class ShimadzuPDFApp(ctk.CTk):
                 for label, line in zip(labels, f.read().splitlines()):
                     entries[label].insert(0, line)
 
+        # Storage backend (lines 6-7); older 5-line configs keep using MySQL
+        backend, sqlite_path = read_storage_config()
+        ctk.CTkLabel(win, text="Storage").pack()
+        backend_menu = ctk.CTkOptionMenu(win, values=STORAGE_BACKENDS)
+        backend_menu.set(backend)
+        backend_menu.pack(fill="x", padx=10, pady=5)
+        ctk.CTkLabel(win, text="SQLite File").pack()
+        sqlite_entry = ctk.CTkEntry(win)
+        sqlite_entry.insert(0, sqlite_path)
+        sqlite_entry.pack(fill="x", padx=10, pady=5)
+
         def save():
             with open(DB_CONFIG_FILE, "w") as f:
                 for label in labels:
                     f.write(entries[label].get().strip() + "\n")
+                f.write(backend_menu.get() + "\n")
+                f.write((sqlite_entry.get().strip() or SQLITE_DB_FILE) + "\n")
+            self.init_db_tables()
             messagebox.showinfo("Saved", "DB config saved.")
 
         ctk.CTkButton(win, text="Save", command=save).pack(pady=10)
 
-    # --------------------- Assay Logic ---------------------
-    def extract_single(self, lines, machine_id, sample_id, user_id):
-        def get_val(label):
-            try:
-                idx = lines.index(label)
-                return lines[idx + 1].lstrip(": ").strip()
-            except:
-                return ""
-
-        header = {
-            "machine_id": machine_id,
-            "u_id": sample_id,
-            "user_id": user_id,
-            "test_code": self.test_code_entry.get().strip(),
-            "acquired_by": get_val("Acquired by"),
-            "sample_name_header": get_val("Sample Name"),
-            "sample_id": get_val("Sample ID"),
-            "tray": int(get_val("Tray#") or 0),
-            "vial": int(get_val("Vial#") or 0),
-            "injection_volume": float(get_val("Injection Volume") or 0),
-            "data_file": get_val("Data File"),
-            "method_file": get_val("Method File"),
-            "batch_file": get_val("Batch File"),
-            "report_format_file": get_val("Report Format File"),
-            "date_acquired": get_val("Date Acquired"),
-            "date_processed": get_val("Date Processed")
-        }
-
-        def get_table_section(label):
-            try:
-                idx = [i for i, val in enumerate(lines) if val.strip().lower() == label.lower()][-1]
-                result = []
-                for i in range(idx + 1, len(lines)):
-                    if lines[i] in ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Tailing Factor", "Theoretical Plate"]:
-                        break
-                    if lines[i].strip() and not lines[i].startswith(":"):
-                        result.append(lines[i].lstrip(": ").strip())
-                return result
-            except:
-                return []
-
-        titles = get_table_section("Title")
-        sample_names = get_table_section("Sample Name")
-        sample_ids = get_table_section("Sample ID")
-        ret_times = get_table_section("Ret. Time")
-        areas = get_table_section("Area")
-        tailing_factors = get_table_section("Tailing Factor")
-        plates = get_table_section("Theoretical Plate")
-        if not plates:
-            plates = get_table_section("Number of Theoretical Plate(USP)")
-
-        rows = []
-        row_count = max(len(titles), len(ret_times))
-        for i in range(row_count):
-            try:
-                row = {
-                    **header,
-                    "title": titles[i] if i < len(titles) else None,
-                    "sample_name": sample_names[i] if i < len(sample_names) else None,
-                    "sample_id_ind": sample_ids[i] if i < len(sample_ids) else None,
-                    "ret_time": float(ret_times[i]) if i < len(ret_times) else None,
-                    "area": float(areas[i]) if i < len(areas) else None,
-                    "tailing_factor": float(tailing_factors[i]) if i < len(tailing_factors) else None,
-                    "theoretical_plate": float(plates[i]) if i < len(plates) else None
-                }
-                rows.append(row)
-            except Exception as e:
-                self.log_status(f"Row {i + 1} skipped: {e}")
-
-        if rows:
-            self.insert_single_db(rows)
-        else:
-            self.log_status("No rows extracted for single-compound file.")
-
-    def insert_single_db(self, rows):
-        try:
-            with open(DB_CONFIG_FILE, "r") as f:
-                host, port, user, pwd, db = f.read().splitlines()
-            conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
-            cursor = conn.cursor()
-
-            columns_to_insert = [
-                "machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header", "sample_id",
-                "tray", "vial", "injection_volume", "data_file", "method_file",
-                "batch_file", "report_format_file", "date_acquired", "date_processed",
-                "title", "sample_name", "sample_id_ind", "ret_time", "area",
-                "tailing_factor", "theoretical_plate"
-            ]
-
-            for row in rows:
-                values = tuple(row.get(col, None) for col in columns_to_insert)
-                cursor.execute(f"""
-                    INSERT INTO shimadzu_lc2050_results (
-                        {', '.join(columns_to_insert)}
-                    ) VALUES ({', '.join(['%s'] * len(columns_to_insert))})
-                """, values)
-
-                disp_vals = tuple("" if v is None else v for v in values)
-                self.tree.insert("", "end", values=disp_vals)
-
-                now = datetime.now()
-                log_file = f"log_{now.strftime('%Y-%m-%d')}.txt"
-                with open(log_file, "a") as f:
-                    f.write(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Inserted Row (single):\n")
-                    for col, val in zip(columns_to_insert, values):
-                        f.write(f"    {col}: {val}\n")
-                    f.write("\n")
-
-            conn.commit()
-            conn.close()
-            self.log_status(f"Inserted {len(rows)} rows into shimadzu_lc2050_results.")
-        except Exception as e:
-            self.log_status(f"DB error (single): {e}")
-
-    # --------------------- Assay Multi ---------------------
-    def _find_compound_starts(self, lines):
-        starts = []
-        for i, l in enumerate(lines):
-            if "compound name" in l.lower():
-                parts = l.split(":", 1)
-                name = parts[1].strip() if len(parts) > 1 else ""
-                starts.append((i, name))
-        return starts
-
-    def _sub_get_table_section(self, sublines, label):
-        try:
-            lc = [s.strip().lower() for s in sublines]
-            label_l = label.lower()
-            idx = len(lc) - 1 - lc[::-1].index(label_l) 
-            result = []
-            for i in range(idx + 1, len(sublines)):
-                val = sublines[i]
-                if val.strip() in ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Tailing Factor",
-                                   "Theoretical Plate", "Number of Theoretical Plate(USP)"]:
-                    break
-                if val.strip() and not val.startswith(":"):
-                    result.append(val.lstrip(": ").strip())
-            return result
-        except Exception:
-            return []
-
-    def extract_multiple(self, lines, machine_id, sample_id, user_id):
-        def parse_float(val):
-            try:
-                return float(val)
-            except:
-                return None
-
-        def get_val(label):
-            try:
-                idx = lines.index(label)
-                return lines[idx + 1].lstrip(": ").strip()
-            except: return ""
-
-        header_common = {
-            "machine_id": machine_id, "u_id": sample_id, "user_id": user_id,
-            "test_code": self.test_code_entry.get().strip(),
-            "acquired_by": get_val("Acquired by"), "sample_name_header": get_val("Sample Name"),
-            "sample_id": get_val("Sample ID"), "tray": int(get_val("Tray#") or 0),
-            "vial": int(get_val("Vial#") or 0), "injection_volume": float(get_val("Injection Volume") or 0),
-            "data_file": get_val("Data File"), "method_file": get_val("Method File"),
-            "batch_file": get_val("Batch File"), "report_format_file": get_val("Report Format File"),
-            "date_acquired": get_val("Date Acquired"), "date_processed": get_val("Date Processed")
-        }
-
-        compound_starts = self._find_compound_starts(lines)
-        if not compound_starts:
-            self.log_status("No compound headers found.")
-            return
+    def open_export_dialog(self):
+        """Export filtered result rows to CSV/Parquet (streamed, runs in background)"""
+        win = ctk.CTkToplevel(self)
+        win.title("Export Results")
+        win.geometry("400x520")
 
-        rows_all = []
-        for idx, (start_index, compound_name) in enumerate(compound_starts):
-            end_index = len(lines)
-            if idx + 1 < len(compound_starts):
-                end_index = compound_starts[idx + 1][0]
-
-            title_idx_in_block = None
-            for i in range(start_index, end_index):
-                if lines[i].strip() == "Title":
-                    title_idx_in_block = i
-                    break
-            if title_idx_in_block is None:
-                for i in range(end_index - 1, start_index - 1, -1):
-                    if lines[i].strip() == "Title":
-                        title_idx_in_block = i
-                        break
-            if title_idx_in_block is None: continue
-
-            sublines = lines[title_idx_in_block:end_index]
-            titles = self._sub_get_table_section(sublines, "Title")
-            sample_names = self._sub_get_table_section(sublines, "Sample Name")
-            sample_ids = self._sub_get_table_section(sublines, "Sample ID")
-            ret_times = self._sub_get_table_section(sublines, "Ret. Time")
-            areas = self._sub_get_table_section(sublines, "Area")
-            tailing_factors = self._sub_get_table_section(sublines, "Tailing Factor")
-            plates = self._sub_get_table_section(sublines, "Theoretical Plate") or self._sub_get_table_section(sublines, "Number of Theoretical Plate(USP)")
-
-            row_count = max(len(titles), len(ret_times), len(areas), len(sample_ids), len(sample_names))
-
-            for i in range(row_count):
-                r = {
-                    **header_common,
-                    "compound_name": compound_name or "",
-                    "title": titles[i] if i < len(titles) else None,
-                    "sample_name": sample_names[i] if i < len(sample_names) else None,
-                    "sample_id_ind": sample_ids[i] if i < len(sample_ids) else None,
-                    "ret_time": parse_float(ret_times[i]) if i < len(ret_times) else None,
-                    "area": parse_float(areas[i]) if i < len(areas) else None,
-                    "tailing_factor": parse_float(tailing_factors[i]) if i < len(tailing_factors) else None,
-                    "theoretical_plate": parse_float(plates[i]) if i < len(plates) else None
-                }
-                rows_all.append(r)
+        ctk.CTkLabel(win, text="Table").pack()
+        table_menu = ctk.CTkOptionMenu(win, values=list(RESULT_TABLES))
+        table_menu.pack(fill="x", padx=10, pady=5)
 
-        if rows_all: self.insert_multi_db(rows_all)
+        entries = {}
+        labels = [("u_id", "Sample ID (u_id)"), ("test_code", "Test Code"), ("machine_id", "Machine ID"),
+                  ("date_from", "From Date (YYYY-MM-DD)"), ("date_to", "To Date (YYYY-MM-DD)")]
+        for key, label in labels:
+            ctk.CTkLabel(win, text=label).pack()
+            ent = ctk.CTkEntry(win)
+            ent.pack(fill="x", padx=10, pady=5)
+            entries[key] = ent
+
+        def run():
+            table = table_menu.get()
+            filters = {key: ent.get().strip() or None for key, ent in entries.items()}
+            out_path = filedialog.asksaveasfilename(
+                defaultextension=".csv", initialfile=f"{table}.csv",
+                filetypes=[("CSV Files", "*.csv"), ("Parquet Files", "*.parquet")])
+            if not out_path:
+                return
+            win.destroy()
+            self.log_status(f"Exporting {table} to {os.path.basename(out_path)}...")
 
-    def insert_multi_db(self, rows):
-        try:
-            with open(DB_CONFIG_FILE, "r") as f:
-                host, port, user, pwd, db = f.read().splitlines()
-            conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
-            cursor = conn.cursor()
+            def worker():
+                conn = None
+                try:
+                    conn = connect_db()
+                    progress = lambda n: self.after(0, self.log_status, f"Exported {n} rows...")
+                    total = stream_export(conn, table, out_path, progress=progress, **filters)
+                    self.after(0, self.log_status, f"Export finished: {total} rows -> {out_path}")
+                except Exception as e:
+                    self.after(0, self.log_status, f"Export error: {e}")
+                finally:
+                    if conn is not None:
+                        conn.close()
 
-            columns_to_insert = [
-                "machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header", "sample_id",
-                "tray", "vial", "injection_volume", "data_file", "method_file",
-                "batch_file", "report_format_file", "date_acquired", "date_processed",
-                "compound_name",
-                "title", "sample_name", "sample_id_ind", "ret_time", "area",
-                "tailing_factor", "theoretical_plate"
-            ]
-
-            for row in rows:
-                values = tuple(row.get(col, None) for col in columns_to_insert)
-                cursor.execute(f"""
-                    INSERT INTO shimadzu_lc2050_multicom_raw (
-                        {', '.join(columns_to_insert)}
-                    ) VALUES ({', '.join(['%s'] * len(columns_to_insert))})
-                """, values)
-
-                disp_vals = tuple("" if v is None else v for v in values)
-                self.tree.insert("", "end", values=disp_vals)
-
-                now = datetime.now()
-                log_file = f"log_{now.strftime('%Y-%m-%d')}.txt"
-                with open(log_file, "a") as f:
-                    f.write(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Inserted Row (multi):\n")
-                    for col, val in zip(columns_to_insert, values):
-                        f.write(f"    {col}: {val}\n")
-                    f.write("\n")
+            threading.Thread(target=worker, daemon=True).start()
 
-            conn.commit()
-            conn.close()
-            self.log_status(f"Inserted {len(rows)} rows into shimadzu_lc2050_multicomponent.")
-        except Exception as e:
-            self.log_status(f"DB error (multi): {e}")
+        ctk.CTkButton(win, text="Export", command=run).pack(pady=10)
 
     # =========================================================================
     # TAB 2 ACTION: DISSOLUTION EXTRACTION (UPDATED)
@@ -821,27 +3611,26 @@ class ShimadzuPDFApp(ctk.CTk):
             # Process non-standard file
             self._process_non_standard_file(s_id_entry, u_id, t_code, m_id, comp_type, release_type, medium, stage_selected)
 
-    def _detect_standard_type_from_pdf(self, lines):
+    def _detect_standard_type_from_pdf(self, report, sample_id=""):
         """
         Detect whether the PDF contains CS or SS from Sample ID field
+        (sample_id: the Sample ID typed in the form, used as fallback)
         Returns: "CS" or "SS" based on PDF content
         """
-        try:
+        lines = report.lines
+
+        def standard_in(text):
+            text = text.upper()
+            return "CS" if "CS" in text else "SS" if "SS" in text else None
+
+        def from_sample_id():
             # Get Sample ID from PDF
-            sample_id_from_pdf = ""
             for i, line in enumerate(lines):
                 if "Sample ID" in line and i + 1 < len(lines):
-                    sample_id_from_pdf = lines[i + 1].lstrip(": ").strip()
-                    break
-            
-            # Check for CS or SS in Sample ID
-            if sample_id_from_pdf:
-                sample_id_upper = sample_id_from_pdf.upper()
-                if "CS" in sample_id_upper:
-                    return "CS"
-                elif "SS" in sample_id_upper:
-                    return "SS"
-            
+                    return standard_in(lines[i + 1].lstrip(": ").strip())
+            return None
+
+        def from_lines():
             # Also check in all lines for CS/SS patterns
             for line in lines:
                 line_upper = line.upper()
@@ -849,16 +3638,22 @@ class ShimadzuPDFApp(ctk.CTk):
                     return "CS"
                 elif " SS " in line_upper or line_upper.endswith(" SS") or line_upper.startswith("SS "):
                     return "SS"
-            
+            return None
+
+        try:
+            # Always Sample ID first: which rule matches depends on the report, not on its layout
+            for rule in (from_sample_id, from_lines):
+                detected = rule()
+                if detected:
+                    return detected
+
             # Check in filename or user input
-            sample_id_entry = self.disso_sample_id.get().strip().upper()
-            if "CS" in sample_id_entry:
-                return "CS"
-            elif "SS" in sample_id_entry:
-                return "SS"
-                
+            detected = standard_in(sample_id)
+            if detected:
+                return detected
+
         except Exception as e:
-            self.disso_log.insert("end", f"Error detecting standard type: {e}\n")
+            self.log_disso(f"Error detecting standard type: {e}")
         
         # Default to CS if not detected
         return "CS"
@@ -868,301 +3663,445 @@ class ShimadzuPDFApp(ctk.CTk):
         files = filedialog.askopenfilenames(filetypes=[("PDF Files", "*.pdf")])
         if not files: 
             return
-        
+
+        job = self._start_job("dissolution_standard", files, {"u_id": sample_id, "user_id": user_id,
+                                                               "test_code": test_code})
+        std_type, grid = self.std_type_var.get(), self.grid_var.get()
+        self._submit_job(job, lambda job: self._run_standard_files(job, sample_id, user_id, test_code, machine_id,
+                                                                   std_type, grid))
+
+    def _run_standard_files(self, job, sample_id, user_id, test_code, machine_id, detected_std_type, grid):
         total_inserted = 0
-        all_inserted_rows = []
+        all_inserted_rows = deque(maxlen=PREVIEW_ROW_LIMIT)  # preview only keeps the newest rows
 
-        try:
-            with open(DB_CONFIG_FILE, "r") as f:
-                host, port, user, pwd, db = f.read().splitlines()
-            conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
-            cursor = conn.cursor()
+        tracker = BatchResourceTracker("Dissolution (standard)")
+        reads = self._read_ahead(job)
 
-            for filepath in files:
+        try:
+            for filepath, data, read_error, read_text in reads:
+                # Cancel is honoured between files; everything before this point is committed
+                if job.cancelled:
+                    break
+                job.begin_file(filepath)
                 filename = os.path.basename(filepath)
-                self.disso_log.insert("end", f"Processing: {filename}\n")
-                
-                with open(filepath, 'rb') as f:
-                    doc = fitz.open(stream=f.read(), filetype='pdf')
-                    lines = [l.strip() for page in doc for l in page.get_text().splitlines() if l.strip()]
+                self.log_disso(f"Processing: {filename} ({read_text})")
+                try:
+                    if read_error:
+                        raise OSError(read_error)
+                    report = ParsedReport(self._extract(filepath, grid, data))
 
                     # Detect CS or SS from PDF content
-                    detected_std_type = self._detect_standard_type_from_pdf(lines)
-                    self.disso_log.insert("end", f"Auto-detected Standard Type: {detected_std_type}\n")
-                    
+                    detected_std_type = self._detect_standard_type_from_pdf(report, sample_id)
+                    self.log_disso(f"Auto-detected Standard Type: {detected_std_type}")
+                
                     # Update UI radio button to show detected type
-                    self.std_type_var.set(detected_std_type)
-
-                    def get_val(lbl):
-                        try:
-                            idx = lines.index(lbl)
-                            return lines[idx+1].lstrip(": ").strip()
-                        except:
-                            return ""
-
-                    extracted_compound = ""
-                    for line in lines:
-                        if "Compound Name" in line:
-                            parts = line.split(":", 1)
-                            if len(parts) > 1:
-                                extracted_compound = parts[1].strip()
-                            break
+                    self.after(0, self.std_type_var.set, detected_std_type)
 
-                    # Header for Standard files
-                    header = {
+                    # For Standard files, take all rows
+                    rows_to_insert = self.ingestor.build_dissolution_rows(report, {
                         "machine_id": machine_id, 
                         "u_id": sample_id,   
                         "user_id": user_id, 
                         "test_code": test_code,
-                        "acquired_by": get_val("Acquired by"), 
-                        "sample_name_header": get_val("Sample Name"),
-                        "sample_id": get_val("Sample ID"), 
-                        "tray": get_val("Tray#"),          
-                        "vial": get_val("Vial#"),          
-                        "injection_volume": get_val("Injection Volume"), 
-                        "data_file": get_val("Data File"), 
-                        "method_file": get_val("Method File"),
-                        "batch_file": get_val("Batch File"),
-                        "report_format_file": get_val("Report Format File"), 
-                        "date_acquired": get_val("Date Acquired"),
-                        "date_processed": get_val("Date Processed"),         
-                        "compound_name": extracted_compound,
                         # Standard-specific fields
                         "component_type": "",
                         "process_type": "",
                         "medium_name": "",
                         "stage": detected_std_type,  # Auto-detected "CS" or "SS"
                         "vessel_id": ""
-                    }
-
-                    def get_col(lbl):
-                        try:
-                            lc = [x.lower() for x in lines]
-                            idx = len(lc) - 1 - lc[::-1].index(lbl.lower())
-                            res = []
-                            stop_headers = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Height", 
-                                          "Tailing Factor", "Theoretical Plate", "Theoretical Plate(USP)", 
-                                          "Number of Theoretical Plate(USP)"]
-                            for i in range(idx+1, len(lines)):
-                                v = lines[i]
-                                if v in stop_headers: break
-                                if not v.startswith(":"): res.append(v)
-                            return res
-                        except: return []
-                    
-                    def get_table_section(label):
-                        try:
-                            idx = [i for i, val in enumerate(lines) if val.strip().lower() == label.lower()][-1]
-                            result = []
-                            stop_headers = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Height", 
-                                          "Tailing Factor", "Theoretical Plate", "Theoretical Plate(USP)"]
-                            for i in range(idx + 1, len(lines)):
-                                if lines[i] in stop_headers:
-                                    break
-                                if lines[i].strip() and not lines[i].startswith(":"):
-                                    result.append(lines[i].lstrip(": ").strip())
-                            return result
-                        except:
-                            return []
-
-                    titles = get_col("Title")
-                    ret_times = get_col("Ret. Time")
-                    areas = get_col("Area")
-                    heights = get_col("Height") 
-                    tailing = get_col("Tailing Factor")
-                    plates = get_col("Theoretical Plate") or get_col("Theoretical Plate(USP)") or get_col("Number of Theoretical Plate(USP)")
-                    
-                    pdf_sample_names_col = get_table_section("Sample Name")
-                    pdf_sample_ids_col = get_table_section("Sample ID")
-
-                    # For Standard files, take all rows
-                    rows_to_insert = []
-                    for i in range(max(len(titles), len(ret_times))):
-                        t = titles[i] if i < len(titles) else ""
-                        
-                        row = header.copy()
-                        row["title"] = t
-                        row["ret_time"] = ret_times[i] if i < len(ret_times) else ""
-                        row["area"] = areas[i] if i < len(areas) else ""
-                        row["height"] = heights[i] if i < len(heights) else "" 
-                        row["tailing_factor"] = tailing[i] if i < len(tailing) else ""
-                        row["theoretical_plate"] = plates[i] if i < len(plates) else "" 
-                        row["sample_name"] = pdf_sample_names_col[i] if i < len(pdf_sample_names_col) else ""
-                        row["sample_id_ind"] = pdf_sample_ids_col[i] if i < len(pdf_sample_ids_col) else ""
-                        
-                        rows_to_insert.append(row)
-
-                    cols = ["machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header",
-                            "sample_id", "tray", "vial", "injection_volume", "report_format_file", "date_processed",
-                            "data_file", "method_file", "batch_file", "date_acquired",
-                            "title", "sample_name", "ret_time", "area", "height", "tailing_factor", "theoretical_plate",
-                            "component_type", "process_type", "medium_name", "stage", "vessel_id",
-                            "compound_name", "sample_id_ind"] 
-
-                    for r in rows_to_insert:
-                        vals = tuple(r.get(c, "") for c in cols)
-                        
-                        cursor.execute(f"INSERT INTO shimadzu_dissolution_raw ({', '.join(cols)}, timestamp) VALUES ({', '.join(['%s']*len(cols))}, NOW())", vals)
-                        total_inserted += 1
-                        self.disso_log.insert("end", f"Saved {detected_std_type} Standard - Area: {r['area']}\n")
-                        all_inserted_rows.append(r)
-
-            conn.commit()
-            conn.close()
-            self._build_diss_treeview(all_inserted_rows)
-            messagebox.showinfo("Success", f"Saved {total_inserted} Standard Rows (Detected: {detected_std_type}).")
+                    }, skip_summary_rows=False)
 
+                    # One retried transaction per file; only committed files reach the checkpoint
+                    self.ingestor.write_dissolution_rows(rows_to_insert, SourcePdf(filepath, data))
+                except DBUnavailableError:
+                    raise
+                except Exception as e:
+                    self.log_disso(f"Error in {filename}: {e}")
+                    job.finish_file(filepath, committed=False)
+                    self._job_progress(job)
+                    continue
+
+                for r in rows_to_insert:
+                    total_inserted += 1
+                    self.log_disso(f"Saved {detected_std_type} Standard - Area: {r['area']}")
+                    all_inserted_rows.append(r)
+
+                job.finish_file(filepath)
+                if tracker.sample(len(rows_to_insert)):
+                    self.log_disso(f"Warning: memory above {BATCH_MEMORY_BUDGET_MB} MB budget")
+                self._job_progress(job)
+
+            self.log_disso(tracker.finish())
+            self.after(0, self._build_diss_treeview, all_inserted_rows)
+            self.after(0, messagebox.showinfo, "Success", f"Saved {total_inserted} Standard Rows (Detected: {detected_std_type}).")
+
+        except DBUnavailableError as e:
+            self.after(0, messagebox.showerror, "Database Unavailable", f"{e}\n\nFinished files are committed; select the same files again to resume.")
         except Exception as e:
-            messagebox.showerror("Error", f"Standard Processing Error: {str(e)}")
+            self.after(0, messagebox.showerror, "Error", f"Standard Processing Error: {str(e)}")
+        finally:
+            reads.close()
+            self.log_disso(self._end_job(job))
 
     def _process_non_standard_file(self, sample_id, user_id, test_code, machine_id, comp_type, release_type, medium, stage_selected):
         """Process Non-Standard files"""
         files = filedialog.askopenfilenames(filetypes=[("PDF Files", "*.pdf")])
         if not files: 
             return
-        
+
+        job = self._start_job("dissolution", files, {"u_id": sample_id, "user_id": user_id, "test_code": test_code,
+                                                     "component_type": comp_type, "release_type": release_type,
+                                                     "medium": medium, "stage": stage_selected})
+        grid = self.grid_var.get()
+        self._submit_job(job, lambda job: self._run_non_standard_files(
+            job, sample_id, user_id, test_code, machine_id, comp_type, release_type, medium, stage_selected, grid))
+
+    def _run_non_standard_files(self, job, sample_id, user_id, test_code, machine_id, comp_type, release_type,
+                                medium, stage_selected, grid):
         total_inserted = 0
-        all_inserted_rows = []
+        all_inserted_rows = deque(maxlen=PREVIEW_ROW_LIMIT)  # preview only keeps the newest rows
 
-        try:
-            with open(DB_CONFIG_FILE, "r") as f:
-                host, port, user, pwd, db = f.read().splitlines()
-            conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
-            cursor = conn.cursor()
+        tracker = BatchResourceTracker("Dissolution (non-standard)")
+        reads = self._read_ahead(job)
 
-            for filepath in files:
+        try:
+            for filepath, data, read_error, read_text in reads:
+                # Cancel is honoured between files; everything before this point is committed
+                if job.cancelled:
+                    break
+                job.begin_file(filepath)
                 filename = os.path.basename(filepath)
-                self.disso_log.insert("end", f"Processing: {filename}\n")
-                
-                with open(filepath, 'rb') as f:
-                    doc = fitz.open(stream=f.read(), filetype='pdf')
-                    lines = [l.strip() for page in doc for l in page.get_text().splitlines() if l.strip()]
-
-                    def get_val(lbl):
-                        try:
-                            idx = lines.index(lbl)
-                            return lines[idx+1].lstrip(": ").strip()
-                        except:
-                            return ""
-
-                    extracted_compound = ""
-                    for line in lines:
-                        if "Compound Name" in line:
-                            parts = line.split(":", 1)
-                            if len(parts) > 1:
-                                extracted_compound = parts[1].strip()
-                            break
+                self.log_disso(f"Processing: {filename} ({read_text})")
+                try:
+                    if read_error:
+                        raise OSError(read_error)
+                    report = ParsedReport(self._extract(filepath, grid, data))
 
-                    # Header for Non-Standard files
-                    header = {
+                    # For Non-Standard files, skip Average rows
+                    rows_to_insert = self.ingestor.build_dissolution_rows(report, {
                         "machine_id": machine_id, 
                         "u_id": sample_id,   
                         "user_id": user_id, 
                         "test_code": test_code,
-                        "acquired_by": get_val("Acquired by"), 
-                        "sample_name_header": get_val("Sample Name"),
-                        "sample_id": get_val("Sample ID"), 
-                        "tray": get_val("Tray#"),          
-                        "vial": get_val("Vial#"),          
-                        "injection_volume": get_val("Injection Volume"), 
-                        "data_file": get_val("Data File"), 
-                        "method_file": get_val("Method File"),
-                        "batch_file": get_val("Batch File"),
-                        "report_format_file": get_val("Report Format File"), 
-                        "date_acquired": get_val("Date Acquired"),
-                        "date_processed": get_val("Date Processed"),         
-                        "compound_name": extracted_compound,
                         # Non-Standard specific fields
                         "component_type": comp_type,
                         "process_type": release_type,
                         "medium_name": medium,
                         "stage": stage_selected,
                         "vessel_id": stage_selected
-                    }
-
-                    def get_col(lbl):
-                        try:
-                            lc = [x.lower() for x in lines]
-                            idx = len(lc) - 1 - lc[::-1].index(lbl.lower())
-                            res = []
-                            stop_headers = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Height", 
-                                          "Tailing Factor", "Theoretical Plate", "Theoretical Plate(USP)", 
-                                          "Number of Theoretical Plate(USP)"]
-                            for i in range(idx+1, len(lines)):
-                                v = lines[i]
-                                if v in stop_headers: break
-                                if not v.startswith(":"): res.append(v)
-                            return res
-                        except: return []
-                    
-                    def get_table_section(label):
-                        try:
-                            idx = [i for i, val in enumerate(lines) if val.strip().lower() == label.lower()][-1]
-                            result = []
-                            stop_headers = ["Title", "Sample Name", "Sample ID", "Ret. Time", "Area", "Height", 
-                                          "Tailing Factor", "Theoretical Plate", "Theoretical Plate(USP)"]
-                            for i in range(idx + 1, len(lines)):
-                                if lines[i] in stop_headers:
-                                    break
-                                if lines[i].strip() and not lines[i].startswith(":"):
-                                    result.append(lines[i].lstrip(": ").strip())
-                            return result
-                        except:
-                            return []
-
-                    titles = get_col("Title")
-                    ret_times = get_col("Ret. Time")
-                    areas = get_col("Area")
-                    heights = get_col("Height") 
-                    tailing = get_col("Tailing Factor")
-                    plates = get_col("Theoretical Plate") or get_col("Theoretical Plate(USP)") or get_col("Number of Theoretical Plate(USP)")
-                    
-                    pdf_sample_names_col = get_table_section("Sample Name")
-                    pdf_sample_ids_col = get_table_section("Sample ID")
+                    }, skip_summary_rows=True)
 
-                    # For Non-Standard files, skip Average rows
-                    rows_to_insert = []
-                    for i in range(max(len(titles), len(ret_times))):
-                        t = titles[i] if i < len(titles) else ""
-                        
-                        # Skip average rows for non-standard files
-                        if t in ["Average", "%RSD", "Standard Deviation", "Std. Dev."]: 
-                            continue
-                        
-                        row = header.copy()
-                        row["title"] = t
-                        row["ret_time"] = ret_times[i] if i < len(ret_times) else ""
-                        row["area"] = areas[i] if i < len(areas) else ""
-                        row["height"] = heights[i] if i < len(heights) else "" 
-                        row["tailing_factor"] = tailing[i] if i < len(tailing) else ""
-                        row["theoretical_plate"] = plates[i] if i < len(plates) else "" 
-                        row["sample_name"] = pdf_sample_names_col[i] if i < len(pdf_sample_names_col) else ""
-                        row["sample_id_ind"] = pdf_sample_ids_col[i] if i < len(pdf_sample_ids_col) else ""
-                        
-                        rows_to_insert.append(row)
-
-                    cols = ["machine_id", "u_id", "user_id", "test_code", "acquired_by", "sample_name_header",
-                            "sample_id", "tray", "vial", "injection_volume", "report_format_file", "date_processed",
-                            "data_file", "method_file", "batch_file", "date_acquired",
-                            "title", "sample_name", "ret_time", "area", "height", "tailing_factor", "theoretical_plate",
-                            "component_type", "process_type", "medium_name", "stage", "vessel_id",
-                            "compound_name", "sample_id_ind"] 
-
-                    for r in rows_to_insert:
-                        vals = tuple(r.get(c, "") for c in cols)
-                        
-                        cursor.execute(f"INSERT INTO shimadzu_dissolution_raw ({', '.join(cols)}, timestamp) VALUES ({', '.join(['%s']*len(cols))}, NOW())", vals)
-                        total_inserted += 1
-                        self.disso_log.insert("end", f"Saved {stage_selected} - Area: {r['area']}\n")
-                        all_inserted_rows.append(r)
+                    # One retried transaction per file; only committed files reach the checkpoint
+                    self.ingestor.write_dissolution_rows(rows_to_insert, SourcePdf(filepath, data))
+                except DBUnavailableError:
+                    raise
+                except Exception as e:
+                    self.log_disso(f"Error in {filename}: {e}")
+                    job.finish_file(filepath, committed=False)
+                    self._job_progress(job)
+                    continue
+
+                for r in rows_to_insert:
+                    total_inserted += 1
+                    self.log_disso(f"Saved {stage_selected} - Area: {r['area']}")
+                    all_inserted_rows.append(r)
+
+                job.finish_file(filepath)
+                if tracker.sample(len(rows_to_insert)):
+                    self.log_disso(f"Warning: memory above {BATCH_MEMORY_BUDGET_MB} MB budget")
+                self._job_progress(job)
+
+            self.log_disso(tracker.finish())
+            self.after(0, self._build_diss_treeview, all_inserted_rows)
+            self.after(0, messagebox.showinfo, "Success", f"Saved {total_inserted} Non-Standard Rows.")
+
+        except DBUnavailableError as e:
+            self.after(0, messagebox.showerror, "Database Unavailable", f"{e}\n\nFinished files are committed; select the same files again to resume.")
+        except Exception as e:
+            self.after(0, messagebox.showerror, "Error", f"Non-Standard Processing Error: {str(e)}")
+        finally:
+            reads.close()
+            self.log_disso(self._end_job(job))
+
+    def _count_rows(self, kind, table, id_rows, source=None):
+        METRICS.inc("shimadzu_rows_inserted_total", len(id_rows), table=table)
+        self._job_add_rows(len(id_rows))
+
+    def _preview_rows(self, kind, table, id_rows, source=None):
+        if kind == "dissolution":
+            return  # the Dissolution tab builds its own preview per run
+        values = [tuple("" if v is None else v for v in row.values()) for _, row in id_rows]
+        self.after(0, self._preview_extend, values)
+
+    def _preview_extend(self, values):
+        for disp_vals in values:
+            if len(self.tree["columns"]) == len(disp_vals):
+                self._preview_append(self.tree, disp_vals)
 
-            conn.commit()
-            conn.close()
-            self._build_diss_treeview(all_inserted_rows)
-            messagebox.showinfo("Success", f"Saved {total_inserted} Non-Standard Rows.")
+    # =========================================================================
+    # BATCH MODE (Manifest-driven, Assay + Dissolution)
+    # =========================================================================
+    def process_manifest_batch(self):
+        """Validate a CSV/Excel manifest, then ingest the selected PDFs as one batch"""
+        manifest_path = filedialog.askopenfilename(
+            filetypes=[("Manifest", "*.csv *.xlsx"), ("CSV Files", "*.csv"), ("Excel Files", "*.xlsx")])
+        if not manifest_path:
+            return
+        try:
+            entries = read_manifest(manifest_path)
+        except Exception as e:
+            messagebox.showerror("Manifest Error", f"Could not read manifest: {e}")
+            return
+
+        default_user = self.user_id_entry.get().strip() or self.disso_user_id.get().strip()
+        errors = validate_manifest(entries, default_user, self.mode_var.get())
+        if errors:
+            more = f"\n... and {len(errors) - 20} more" if len(errors) > 20 else ""
+            messagebox.showwarning("Manifest Validation", "\n".join(errors[:20]) + more)
+            return
 
+        files = filedialog.askopenfilenames(initialdir=os.path.dirname(manifest_path), filetypes=[("PDF Files", "*.pdf")])
+        if not files:
+            return
+        by_path, pending, ambiguous, missing = match_manifest(entries, files)
+        if ambiguous:
+            messagebox.showwarning("Manifest Validation", "More than one manifest entry for:\n" + "\n".join(ambiguous[:20]))
+            return
+        if missing:
+            more = f"\n... and {len(missing) - 20} more" if len(missing) > 20 else ""
+            listed = "\n".join(f"Line {e['_line']}: {e.get('file') or e.get('data_file')}" for e in missing[:20])
+            if not messagebox.askyesno("Manifest Validation", f"{len(missing)} manifest row(s) name a PDF that was "
+                                       f"not selected:\n{listed}{more}\n\nIngest the selected files without them?"):
+                return
+        unmatched = [f for f in files if f not in by_path]
+        if unmatched and not pending:
+            messagebox.showwarning("Manifest Validation", "No manifest entry for:\n" +
+                                   "\n".join(os.path.basename(f) for f in unmatched[:20]))
+            return
+
+        # Show the Assay preview in the manifest's mode when it is not mixed
+        modes = {e["mode"] for e in entries if e["kind"] == "assay"}
+        if len(modes) == 1 and self.mode_var.get() not in modes:
+            self.mode_var.set(modes.pop())
+            self._build_treeview()
+
+        self.log_status(f"Batch: {len(files)} files, {len(entries)} manifest rows, {len(by_path)} matched by file name")
+        job = self._start_job("batch", files, {"manifest": os.path.abspath(manifest_path)})
+        machine_id, by_sequence, grid = self.machine_id_entry.get().strip(), self.sequence_var.get(), self.grid_var.get()
+
+        def run(job):
+            try:
+                self._run_manifest_batch(job, by_path, pending, machine_id, by_sequence, grid)
+            finally:
+                self.log_status(self._end_job(job))
+        self._submit_job(job, run)
+
+    def _run_manifest_batch(self, job, by_path, pending, machine_id, by_sequence, grid):
+        counts = {"assay": 0, "dissolution": 0, "skipped": 0}
+        diss_rows = deque(maxlen=PREVIEW_ROW_LIMIT)
+        tracker = BatchResourceTracker("Manifest batch")
+
+        try:
+            if not by_sequence:
+                extracted = self._extract_ahead(job, job.pending_files(), grid)
+                try:
+                    for filepath, data, read_text, lines, error in extracted:
+                        # Cancel is honoured between files/sequences; everything before this point is committed
+                        if job.cancelled:
+                            break
+                        parsed = ParsedReport(lines) if lines else None
+                        entry = self._manifest_entry(job, filepath, parsed, error, by_path, pending, counts)
+                        if entry is not None:
+                            report = {"path": filepath, "source": SourcePdf(filepath, data), "report": parsed,
+                                      "entry": entry, "read": read_text}
+                            self._ingest_sequence(job, [report], machine_id, counts, diss_rows, tracker)
+                finally:
+                    extracted.close()
+            else:
+                # Sequences need every header first: a first pass reads page 1 and keeps only the header
+                # values, then each sequence is extracted, parsed and written before the next one
+                headers = []
+                extracted = self._extract_ahead(job, job.pending_files(), False, pages=1)
+                try:
+                    for filepath, _, _, lines, error in extracted:
+                        if job.cancelled:
+                            break
+                        parsed = ParsedReport(lines) if lines else None
+                        entry = self._manifest_entry(job, filepath, parsed, error, by_path, pending, counts)
+                        if entry is not None:
+                            headers.append({"path": filepath, "header": parsed.header, "entry": entry,
+                                            "standard": entry["kind"] == "dissolution" and entry["stage"] in STANDARD_STAGES})
+                finally:
+                    extracted.close()
+
+                sequences = [] if job.cancelled else group_sequences(headers)
+                if sequences:
+                    self.log_status(f"{len(headers)} files in {len(sequences)} sequences")
+                for sequence in sequences:
+                    if job.cancelled:
+                        break
+                    self._ingest_sequence(job, self._extract_sequence(job, sequence, grid, counts),
+                                          machine_id, counts, diss_rows, tracker)
+            completed = not job.cancelled
+        except DBUnavailableError as e:
+            self.log_status(f"Database unavailable: {e}. Run the same manifest again to resume.")
+            completed = False
         except Exception as e:
-            messagebox.showerror("Error", f"Non-Standard Processing Error: {str(e)}")
+            self.log_status(f"Batch error: {e}")
+            completed = False
+
+        self.log_status(tracker.finish())
+        if diss_rows:
+            self.after(0, self._build_diss_treeview, diss_rows)
+        summary = (f"Batch finished: {counts['assay']} assay files, {counts['dissolution']} dissolution files, "
+                   f"{counts['skipped']} skipped.")
+        if completed and pending:
+            # Every report header was seen: these data_file rows were never ingested in this run
+            for key, e in pending.items():
+                self.log_status(f"Manifest line {e['_line']}: no report with Data File {key}")
+            summary += f" {len(pending)} manifest row(s) matched no report (see the status log)."
+        if job.cancelled:
+            summary = "Batch cancelled. " + summary
+        self.log_status(summary)
+        self.after(0, messagebox.showinfo, "Batch Complete", summary)
+
+    def _manifest_entry(self, job, filepath, report, error, by_path, pending, counts):
+        """Manifest entry for an extracted file, or None (file finished as skipped)"""
+        job.begin_file(filepath)
+        filename = os.path.basename(filepath)
+        if error:
+            self.log_status(f"Error: {filename}: {error}")
+            counts["skipped"] += 1
+            job.finish_file(filepath, committed=False)
+            return None
+        if report is None:
+            self.log_status(f"No text extracted from {filename} (image PDF?)")
+            counts["skipped"] += 1
+            job.finish_file(filepath)
+            return None
+
+        entry = by_path.get(filepath)
+        if entry is None:
+            entry = pending.pop(report.value("Data File").lower(), None)
+        if entry is None:
+            self.log_status(f"Skipped {filename}: not in manifest")
+            counts["skipped"] += 1
+            job.finish_file(filepath)
+        return entry
+
+    def _extract_ahead(self, job, files, grid, pages=None):
+        """
+        Iterate (path, data, read timing text, lines, error) over files: read ahead and extracted
+        in the shared pools with a few files in flight, handed back in file order
+        """
+        pool = self._extract_pool()
+        reads = self._read_ahead(job, files)
+        extracting = deque()  # (path, data, read timing text, extraction future or None, read error)
+
+        def fill():
+            while len(extracting) <= EXTRACT_WORKERS:
+                item = next(reads, None)
+                if item is None:
+                    return
+                filepath, data, read_error, read_text = item
+                future = None if read_error else pool.submit(extract_pdf_lines_safe, filepath, grid, data, pages)
+                extracting.append((filepath, data, read_text, future, read_error))
+
+        try:
+            fill()
+            while extracting:
+                filepath, data, read_text, future, error = extracting.popleft()
+                fill()
+                lines = None
+                if future is not None:
+                    lines, error, seconds = future.result()
+                    METRICS.observe("shimadzu_pdf_extract_seconds", seconds)
+                yield filepath, data, read_text, lines, error
+        finally:
+            # Drop this run's reads and extraction work that are still queued (the pools are shared)
+            reads.close()
+            for _, _, _, future, _ in extracting:
+                if future is not None:
+                    future.cancel()
+
+    def _extract_sequence(self, job, sequence, grid, counts):
+        """Read, extract and parse the reports of one sequence (header records, in order) for _ingest_sequence"""
+        entries = {rep["path"]: rep["entry"] for rep in sequence}
+        reports = []
+        extracted = self._extract_ahead(job, list(entries), grid)
+        try:
+            for filepath, data, read_text, lines, error in extracted:
+                parsed = ParsedReport(lines) if lines else None
+                if self._manifest_entry(job, filepath, parsed, error, entries, {}, counts) is not None:
+                    reports.append({"path": filepath, "source": SourcePdf(filepath, data), "report": parsed,
+                                    "entry": entries[filepath], "read": read_text})
+        finally:
+            extracted.close()
+        return reports
+
+    def _manifest_rows(self, entry, report, machine_id):
+        """(kind, rows) for one parsed report as described by its manifest entry"""
+        if entry["kind"] == "assay":
+            if entry["mode"] == "single":
+                return "single", self.ingestor.parse_single(report, machine_id, entry["u_id"], entry["user_id"],
+                                                            entry["test_code"])
+            return "multi", self.ingestor.parse_multiple(report.lines, machine_id, entry["u_id"], entry["user_id"],
+                                                         entry["test_code"])
+
+        standard = entry["stage"] in STANDARD_STAGES
+        return "dissolution", self.ingestor.build_dissolution_rows(report, {
+            "machine_id": machine_id,
+            "u_id": entry["u_id"],
+            "user_id": entry["user_id"],
+            "test_code": entry["test_code"],
+            "component_type": "" if standard else entry["component_type"],
+            "process_type": entry["release_type"],
+            "medium_name": entry.get("medium", ""),
+            "stage": entry["stage"],
+            "vessel_id": entry["vessel"],
+        }, skip_summary_rows=not standard)
+
+    def _ingest_sequence(self, job, sequence, machine_id, counts, diss_rows, tracker):
+        """Parse every report of a sequence (standards first) and commit them in one transaction"""
+        parsed = []
+        for report in sequence:
+            filepath, entry = report["path"], report["entry"]
+            job.begin_file(filepath)
+            self.log_status(f"Processing: {os.path.basename(filepath)} -> u_id {entry['u_id']} ({report['read']})")
+            try:
+                parsed.append((report, *self._manifest_rows(entry, report["report"], machine_id)))
+            except Exception as e:
+                self.log_status(f"Error: {os.path.basename(filepath)}: {e}")
+                counts["skipped"] += 1
+                job.finish_file(filepath, committed=False)
+        if not parsed:
+            return
+
+        try:
+            self.ingestor.write_parts([(kind, rows, report["source"]) for report, kind, rows in parsed if rows])
+        except DBUnavailableError:
+            raise
+        except Exception as e:
+            self.log_status(f"DB error, {len(parsed)} file(s) not saved: {e}")
+            for report, _, _ in parsed:
+                counts["skipped"] += 1
+                job.finish_file(report["path"], committed=False)
+            self._job_progress(job)
+            return
+
+        for report, kind, rows in parsed:
+            if kind == "dissolution":
+                self.log_disso(f"Saved {len(rows)} rows ({report['entry']['stage']}) "
+                               f"from {os.path.basename(report['path'])}")
+                diss_rows.extend(rows)
+                counts["dissolution"] += 1
+            else:
+                counts["assay"] += 1
+            job.finish_file(report["path"])
+            report["report"] = report["source"] = None  # done with text and bytes; keeps batches within the memory budget
+        if tracker.sample(sum(len(rows) for _, _, rows in parsed)):
+            self.log_status(f"Warning: memory above {BATCH_MEMORY_BUDGET_MB} MB budget")
+        self._job_progress(job)
 
     def _build_diss_treeview(self, data=None):
         for w in self.diss_tree_container.winfo_children():
@@ -1210,6 +4149,188 @@ class ShimadzuPDFApp(ctk.CTk):
                 values = tuple(row_data.get(col, "") for col in diss_cols)
                 self.diss_tree.insert("", "end", values=values, tags=("Dissolution.Treeview",))
 
+    # =========================================================================
+    # TAB 3: HISTORY (Keyset-paginated search over past results)
+    # =========================================================================
+    def setup_history_tab(self):
+        main_frame = ctk.CTkFrame(self.tab_history, fg_color="#DCEDC8")
+        main_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        # --- 1. Search Fields ---
+        search_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        search_frame.pack(fill="x", pady=5)
+        for i in range(6): search_frame.columnconfigure(i, weight=1)
+
+        ctk.CTkLabel(search_frame, text="Table", font=("Arial", 11)).grid(row=0, column=0, sticky="w", padx=5)
+        ctk.CTkLabel(search_frame, text="Sample ID (u_id)", font=("Arial", 11)).grid(row=0, column=1, sticky="w", padx=5)
+        ctk.CTkLabel(search_frame, text="PDF Sample ID", font=("Arial", 11)).grid(row=0, column=2, sticky="w", padx=5)
+        ctk.CTkLabel(search_frame, text="Compound", font=("Arial", 11)).grid(row=0, column=3, sticky="w", padx=5)
+        ctk.CTkLabel(search_frame, text="Date (YYYY-MM-DD)", font=("Arial", 11)).grid(row=0, column=4, sticky="w", padx=5)
+        ctk.CTkLabel(search_frame, text="Text (local mirror)", font=("Arial", 11)).grid(row=0, column=5, sticky="w", padx=5)
+
+        self.history_table = ctk.CTkOptionMenu(search_frame, height=30, values=list(RESULT_TABLES))
+        self.history_table.grid(row=1, column=0, sticky="ew", padx=5, pady=(0, 10))
+        self.history_u_id = ctk.CTkEntry(search_frame, height=30, placeholder_text="u_id")
+        self.history_u_id.grid(row=1, column=1, sticky="ew", padx=5, pady=(0, 10))
+        self.history_sample_id = ctk.CTkEntry(search_frame, height=30, placeholder_text="Starts with...")
+        self.history_sample_id.grid(row=1, column=2, sticky="ew", padx=5, pady=(0, 10))
+        self.history_compound = ctk.CTkEntry(search_frame, height=30, placeholder_text="Starts with...")
+        self.history_compound.grid(row=1, column=3, sticky="ew", padx=5, pady=(0, 10))
+        self.history_date = ctk.CTkEntry(search_frame, height=30, placeholder_text="YYYY-MM-DD")
+        self.history_date.grid(row=1, column=4, sticky="ew", padx=5, pady=(0, 10))
+        self.history_text = ctk.CTkEntry(search_frame, height=30, placeholder_text="Sample, compound, file...")
+        self.history_text.grid(row=1, column=5, sticky="ew", padx=5, pady=(0, 10))
+
+        # --- 2. Buttons / Paging ---
+        btn_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        btn_frame.pack(fill="x", pady=5)
+        ctk.CTkButton(btn_frame, text="Search", command=self.history_search,
+                      fg_color="#2CC985", hover_color="#229A65", font=("Arial", 13, "bold"), height=35).pack(side="left", padx=(0, 10))
+        self.history_prev_btn = ctk.CTkButton(btn_frame, text="< Newer", command=self.history_prev_page, width=100, state="disabled")
+        self.history_prev_btn.pack(side="left", padx=5)
+        self.history_next_btn = ctk.CTkButton(btn_frame, text="Older >", command=self.history_next_page, width=100, state="disabled")
+        self.history_next_btn.pack(side="left", padx=5)
+        self.history_page_label = ctk.CTkLabel(btn_frame, text="", font=("Arial", 11))
+        self.history_page_label.pack(side="left", padx=10)
+
+        self.history_local_var = ctk.BooleanVar(value=False)
+        ctk.CTkButton(btn_frame, text="Sync Mirror", command=self.sync_mirror, fg_color="#607D8B", width=100).pack(side="right", padx=5)
+        ctk.CTkCheckBox(btn_frame, text="Local mirror (offline)", variable=self.history_local_var).pack(side="right", padx=10)
+
+        self.history_tree_container = ctk.CTkFrame(main_frame)
+        self.history_tree_container.pack(fill="both", expand=True, pady=5)
+
+        # Paging state: page_starts holds the before_id of every page shown so far (None = newest page)
+        self.history_query = None
+        self.history_page_starts = []
+        self.history_generation = 0
+        self.history_prefetch = {}
+        self.history_rows = []
+        self.history_cols = []
+
+    def history_search(self):
+        date = self.history_date.get().strip() or None
+        self.history_query = {
+            "table": self.history_table.get(),
+            "u_id": self.history_u_id.get().strip() or None,
+            "sample_id": self.history_sample_id.get().strip() or None,
+            "compound": self.history_compound.get().strip() or None,
+            "date_from": date,
+            "date_to": date,
+        }
+        text = self.history_text.get().strip()
+        if text or self.history_local_var.get():
+            # Full-text search is only available on the local mirror
+            if self.mirror is None:
+                messagebox.showwarning("Local Mirror", "The local mirror is not available.")
+                return
+            self.history_query["local"] = True
+            self.history_query["text"] = text or None
+        # New generation invalidates any prefetch still running for the old query
+        self.history_generation += 1
+        self.history_prefetch = {}
+        self.history_page_starts = [None]
+        self._history_load_page(None)
+
+    def history_next_page(self):
+        if not self.history_rows:
+            return
+        before_id = self.history_rows[-1][self.history_cols.index("id")]
+        self.history_page_starts.append(before_id)
+        self._history_load_page(before_id)
+
+    def history_prev_page(self):
+        if len(self.history_page_starts) > 1:
+            self.history_page_starts.pop()
+            self._history_load_page(self.history_page_starts[-1])
+
+    def _history_fetch(self, before_id, generation, callback):
+        """Fetch one page on a worker thread and hand the result back to the UI thread"""
+        query = dict(self.history_query)
+        table = query.pop("table")
+
+        def worker():
+            conn = None
+            try:
+                if query.pop("local", False):
+                    cols, rows = self.mirror.query_page(table, before_id=before_id, **query)
+                    self.after(0, callback, generation, before_id, cols, rows, None)
+                    return
+                conn = connect_db()
+                cols, rows = fetch_history_page(conn, table, before_id=before_id, **query)
+                self.after(0, callback, generation, before_id, cols, rows, None)
+            except Exception as e:
+                self.after(0, callback, generation, before_id, [], [], e)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _history_load_page(self, before_id):
+        self.history_prev_btn.configure(state="disabled")
+        self.history_next_btn.configure(state="disabled")
+        if before_id in self.history_prefetch:
+            cols, rows = self.history_prefetch.pop(before_id)
+            self._history_render(cols, rows)
+            return
+        self.history_page_label.configure(text="Loading...")
+        self._history_fetch(before_id, self.history_generation, self._history_on_page)
+
+    def _history_on_page(self, generation, before_id, cols, rows, error):
+        if generation != self.history_generation or before_id != self.history_page_starts[-1]:
+            return
+        if error:
+            self.history_page_label.configure(text=f"Error: {error}")
+            return
+        self._history_render(cols, rows)
+
+    def _history_on_prefetch(self, generation, before_id, cols, rows, error):
+        if generation == self.history_generation and not error:
+            self.history_prefetch[before_id] = (cols, rows)
+
+    def _history_render(self, cols, rows):
+        self.history_cols, self.history_rows = cols, rows
+        self._build_history_treeview(cols, rows)
+
+        page_no = len(self.history_page_starts)
+        self.history_page_label.configure(text=f"Page {page_no} ({len(rows)} rows)")
+        self.history_prev_btn.configure(state="normal" if page_no > 1 else "disabled")
+
+        # A full page means there may be more: enable paging and prefetch the next page now
+        if len(rows) == HISTORY_PAGE_SIZE:
+            self.history_next_btn.configure(state="normal")
+            next_before = rows[-1][cols.index("id")]
+            if next_before not in self.history_prefetch:
+                self._history_fetch(next_before, self.history_generation, self._history_on_prefetch)
+
+    def _build_history_treeview(self, cols, rows):
+        for w in self.history_tree_container.winfo_children():
+            w.destroy()
+
+        style = ttk.Style()
+        style.theme_use("clam")
+        style.configure("History.Treeview", background="white", foreground="black", fieldbackground="white", rowheight=25)
+        style.configure("History.Treeview.Heading", background="#E0E0E0", foreground="black", font=("Arial", 9, "bold"))
+
+        self.history_tree = ttk.Treeview(self.history_tree_container, columns=cols, show='headings', style="History.Treeview")
+        for col in cols:
+            self.history_tree.heading(col, text=col)
+            width = 80 if col in ["id", "tray", "vial", "stage", "vessel_id"] else 130
+            self.history_tree.column(col, width=width, anchor="center")
+
+        y_scroll = ttk.Scrollbar(self.history_tree_container, orient="vertical", command=self.history_tree.yview)
+        x_scroll = ttk.Scrollbar(self.history_tree_container, orient="horizontal", command=self.history_tree.xview)
+        self.history_tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.history_tree.grid(row=0, column=0, sticky="nsew")
+        y_scroll.grid(row=0, column=1, sticky="ns")
+        x_scroll.grid(row=1, column=0, sticky="ew")
+        self.history_tree_container.rowconfigure(0, weight=1)
+        self.history_tree_container.columnconfigure(0, weight=1)
+
+        for row in rows:
+            self.history_tree.insert("", "end", values=tuple("" if v is None else v for v in row))
+
     # --- Tab Animation Logic ---
     def tabview_callback(self):
         """Called whenever a tab is clicked/selected."""
@@ -1231,11 +4352,224 @@ class ShimadzuPDFApp(ctk.CTk):
     def animate_tab_switch(self, from_tab, to_tab):
         pass 
 
+    # --------------------- ingestion jobs (progress / cancel / resume) ---------------------
+    def _build_job_bar(self, parent, tab):
+        frame = ctk.CTkFrame(parent, fg_color="transparent")
+        frame.pack(fill="x", padx=5, pady=(0, 5))
+        bar = ctk.CTkProgressBar(frame, height=12)
+        bar.set(0)
+        bar.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        label = ctk.CTkLabel(frame, text="Idle", font=("Consolas", 10), width=420, anchor="w")
+        label.pack(side="left", padx=5)
+        cancel_btn = ctk.CTkButton(frame, text="Cancel", command=lambda: self.cancel_tab_jobs(tab), state="disabled",
+                                   fg_color="#E57373", hover_color="#D32F2F", width=80, height=24)
+        cancel_btn.pack(side="right")
+        ctk.CTkCheckBox(frame, text="Profile next run", variable=self.profile_next_var, width=120,
+                        font=("Arial", 10)).pack(side="right", padx=5)
+        self.job_bars[tab] = (bar, label, cancel_btn)
+
+    def _start_job(self, kind, files, params):
+        """Create the job for a run, offering to resume from the checkpoint"""
+        done = []
+        state = self.checkpoint.get(kind)
+        # A queued or running job of the same kind still owns that checkpoint entry
+        busy = any(j.kind == kind for j in self.scheduler.active())
+        if not busy and state and state.get("done") and set(state["files"]) == set(files) and state["params"] == params:
+            remaining = len(files) - len(state["done"])
+            if messagebox.askyesno("Resume", f"A previous run already committed {len(state['done'])} of {len(files)} files.\n"
+                                             f"Skip those and process the remaining {remaining}?"):
+                done = [f for f in state["done"] if f in files]
+
+        job = IngestJob(kind, self.tabview.get(), files, params, self.checkpoint, done)
+        if self.profile_next_var.get() or self.profile_always:
+            self.profile_next_var.set(False)
+            job.profile = True
+        return job
+
+    def _submit_job(self, job, body):
+        """Queue body(job) on the scheduler; it runs on a job thread, so UI updates go through after()"""
+        def run(job):
+            if job.profile:
+                job.profiler = BatchProfiler(job.kind).start()  # samples the thread that starts it
+            body(job)
+
+        bar, label, _ = self._job_bar(job)
+        bar.set(0)
+        label.configure(text=f"Queued ({job.total} files, {job.skipped} already done)")
+        self.scheduler.submit(job, run)
+
+    def _job_bar(self, job):
+        return self.job_bars.get(job.tab, self.job_bars["Assay"])
+
+    def _job_refresh(self, job):
+        bar, label, _ = self._job_bar(job)
+        bar.set(job.fraction())
+        label.configure(text=job.status_text())
+
+    def _job_progress(self, job):
+        """Refresh the job's progress bar (from its own thread)"""
+        self.after(0, self._job_refresh, job)
+
+    def _job_add_rows(self, n=1):
+        job = getattr(threading.current_thread(), "ingest_job", None)
+        if job is not None:
+            job.add_rows(n)
+
+    def _end_job(self, job):
+        if job.profiler is not None:
+            profiler, job.profiler = job.profiler, None
+            try:
+                name = profiler.stop(pdfs=job.files, rows=job.rows)
+                written = f"{name}.pstats / .collapsed" if profiler.profile else f"{name}.collapsed (sampled only)"
+                self.log_status(f"Profile written: {written}")
+            except OSError as e:
+                self.log_status(f"Profile write error: {e}")
+        try:
+            self.layouts.save()
+        except OSError as e:
+            self.log_status(f"Layout profile save error: {e}")
+        job.close()
+        elapsed = time.monotonic() - job.started
+        if job.cancelled:
+            text = f"Cancelled: {len(job.done)}/{len(job.files)} files committed, run again to resume"
+        else:
+            text = f"Done: {job.processed} files, {job.rows} rows in {elapsed:.1f}s"
+            if job.failed:
+                text += f" ({job.failed} failed, run again to retry them)"
+            text += (f" | read {job.read_bytes / 1e6:.1f} MB in {job.read_seconds:.1f}s, "
+                     f"parsing waited {job.read_wait:.1f}s on reads")
+        self.after(0, self._job_ended, job, text)
+        return text
+
+    def _job_ended(self, job, text):
+        bar, label, _ = self._job_bar(job)
+        bar.set(job.fraction())
+        label.configure(text=text)
+
+    def cancel_tab_jobs(self, tab):
+        """Cancel the queued and running jobs started from a tab"""
+        for job in self.scheduler.active(tab):
+            self.scheduler.cancel(job)
+            if job.status == "running":
+                self._job_refresh(job)
+
+    def on_close(self):
+        active = self.scheduler.active()
+        if active and not messagebox.askyesno("Jobs Running", f"{len(active)} ingestion job(s) are queued or running.\n"
+                                                              "Cancel them and exit? Committed files are kept."):
+            return
+        self.scheduler.shutdown()
+        self.storage.close()
+        self.destroy()
+
+    # --------------------- jobs tab ---------------------
+    def setup_jobs_tab(self):
+        main_frame = ctk.CTkFrame(self.tab_jobs, fg_color="#E3F2FD")
+        main_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        btn_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        btn_frame.pack(fill="x", pady=5)
+        ctk.CTkButton(btn_frame, text="Cancel Selected", command=self.jobs_cancel_selected,
+                      fg_color="#E57373", hover_color="#D32F2F", width=130).pack(side="left", padx=(0, 10))
+        ctk.CTkButton(btn_frame, text="Run Next", command=self.jobs_run_next, width=100).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Clear Finished", command=self.scheduler.clear_finished,
+                      fg_color="#607D8B", width=120).pack(side="left", padx=5)
+        self.jobs_summary_label = ctk.CTkLabel(btn_frame, text="", font=("Arial", 11))
+        self.jobs_summary_label.pack(side="right", padx=10)
+
+        container = ctk.CTkFrame(main_frame)
+        container.pack(fill="both", expand=True, pady=5)
+        style = ttk.Style()
+        style.configure("Jobs.Treeview", background="white", foreground="black", fieldbackground="white", rowheight=25)
+        style.configure("Jobs.Treeview.Heading", background="#E0E0E0", foreground="black", font=("Arial", 9, "bold"))
+
+        cols = ["id", "kind", "tab", "status", "priority", "files", "done", "failed", "rows", "elapsed", "read",
+                "read wait", "current"]
+        self.jobs_tree = ttk.Treeview(container, columns=cols, show='headings', style="Jobs.Treeview")
+        for col in cols:
+            self.jobs_tree.heading(col, text=col)
+            width = 60 if col in ["id", "priority", "files", "done", "failed"] else 260 if col == "current" else 110
+            self.jobs_tree.column(col, width=width, anchor="center")
+        y_scroll = ttk.Scrollbar(container, orient="vertical", command=self.jobs_tree.yview)
+        self.jobs_tree.configure(yscrollcommand=y_scroll.set)
+        self.jobs_tree.grid(row=0, column=0, sticky="nsew")
+        y_scroll.grid(row=0, column=1, sticky="ns")
+        container.rowconfigure(0, weight=1)
+        container.columnconfigure(0, weight=1)
+
+    def _jobs_changed(self):
+        """Scheduler callback (any thread): redraw the Jobs tab on the UI thread"""
+        self.after(0, self._refresh_jobs)
+
+    def _refresh_jobs(self):
+        jobs = self.scheduler.snapshot()
+        shown = {str(job.id) for job in jobs}
+        for iid in self.jobs_tree.get_children():
+            if iid not in shown:
+                self.jobs_tree.delete(iid)
+        for job in jobs:
+            values = (job.id, job.kind, job.tab, job.status, job.priority, job.total, job.processed, job.failed,
+                      job.rows, f"{job.elapsed():.1f}s", f"{job.read_seconds:.1f}s", f"{job.read_wait:.1f}s",
+                      job.current if job.status == "running" else job.error or "")
+            if self.jobs_tree.exists(str(job.id)):
+                self.jobs_tree.item(str(job.id), values=values)
+            else:
+                self.jobs_tree.insert("", "end", iid=str(job.id), values=values)
+
+        active = self.scheduler.active()
+        running = sum(1 for job in active if job.status == "running")
+        self.jobs_summary_label.configure(text=f"{running} running, {len(active) - running} queued")
+        for tab, (_, _, cancel_btn) in self.job_bars.items():
+            cancel_btn.configure(state="normal" if any(job.tab == tab for job in active) else "disabled")
+        # Keep the elapsed / row counters moving while something runs
+        if active and not self._jobs_tick:
+            self._jobs_tick = True
+            self.after(JOBS_REFRESH_MS, self._jobs_tick_refresh)
+
+    def _jobs_tick_refresh(self):
+        self._jobs_tick = False
+        self._refresh_jobs()
+
+    def _selected_jobs(self):
+        selected = {int(iid) for iid in self.jobs_tree.selection()}
+        return [job for job in self.scheduler.snapshot() if job.id in selected]
+
+    def jobs_cancel_selected(self):
+        for job in self._selected_jobs():
+            if job.status in ("queued", "running"):
+                self.scheduler.cancel(job)
+
+    def jobs_run_next(self):
+        for job in self._selected_jobs():
+            if job.status == "queued":
+                self.scheduler.run_next(job)
+
     # --------------------- logging & license ---------------------
     def log_status(self, msg):
+        if threading.current_thread() is not threading.main_thread():
+            self.after(0, self.log_status, msg)  # job threads never touch Tk widgets directly
+            return
         self.status_box.insert("end", msg+"\n")
+        # Keep the status box bounded on long batches
+        line_count = int(self.status_box.index("end-1c").split(".")[0])
+        if line_count > STATUS_LOG_LINES:
+            self.status_box.delete("1.0", f"{line_count - STATUS_LOG_LINES}.0")
         self.status_box.see("end")
 
+    def log_disso(self, msg):
+        """Append a line to the Dissolution log (any thread)"""
+        if threading.current_thread() is not threading.main_thread():
+            self.after(0, self.log_disso, msg)
+            return
+        self.disso_log.insert("end", msg + "\n")
+
+    def _preview_append(self, tree, values):
+        """Insert a preview row, dropping the oldest ones beyond PREVIEW_ROW_LIMIT"""
+        tree.insert("", "end", values=values)
+        children = tree.get_children()
+        if len(children) > PREVIEW_ROW_LIMIT:
+            tree.delete(*children[:len(children) - PREVIEW_ROW_LIMIT])
+
     def show_license(self):
         license_win = ctk.CTkToplevel(self)
         license_win.title("License Information")
@@ -1281,6 +4615,365 @@ class ShimadzuPDFApp(ctk.CTk):
         close_btn.pack(pady=5)
 
 
+# =========================================================================
+# COMMAND LINE TOOLS
+# =========================================================================
+def cli_export(args):
+    conn = connect_db()
+    try:
+        def progress(n):
+            print(f"\r{n} rows", end="", file=sys.stderr, flush=True)
+        total = stream_export(conn, args.table, args.out, fmt=args.format, chunk_size=args.chunk_size,
+                              progress=progress, u_id=args.u_id, test_code=args.test_code,
+                              date_from=args.date_from, date_to=args.date_to, machine_id=args.machine_id)
+        print(f"\nExported {total} rows from {args.table} to {args.out}", file=sys.stderr)
+    finally:
+        conn.close()
+
+
+def cli_mirror_sync(args):
+    mirror = LocalMirror(args.mirror)
+    conn = connect_db()
+    try:
+        added = mirror.sync(conn, progress=lambda table, last_id: print(f"{table}: up to id {last_id}", file=sys.stderr))
+        print(f"Local mirror synced: {added} new rows", file=sys.stderr)
+    finally:
+        conn.close()
+        mirror.close()
+
+
+def cli_audit(args):
+    audit = AuditLog(args.dir, compress=False)
+    try:
+        started = time.perf_counter()
+        records = audit.lookup(u_id=args.u_id, sample_id=args.sample_id, data_file=args.data_file, limit=args.limit)
+        for rec in records:
+            print(json.dumps(rec, default=str))
+        print(f"{len(records)} records in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        audit.close()
+
+
+def cli_archive(args):
+    if not os.path.exists(os.path.join(args.dir, ARCHIVE_INDEX_FILE)):
+        print(f"No PDF archive in {args.dir}", file=sys.stderr)
+        return
+    archive = PdfArchive(args.dir)
+    try:
+        if args.extract_traces:
+            pending = archive.without_traces()
+            started = time.perf_counter()
+            total = 0
+            for n, sha256 in enumerate(pending, 1):
+                try:
+                    total += archive.add_traces(sha256, archive.read(sha256))
+                except Exception as e:
+                    print(f"\n{sha256}: {e}", file=sys.stderr)
+                print(f"\r{n}/{len(pending)} files, {total} traces", end="", file=sys.stderr, flush=True)
+            print(f"\nExtracted {total} traces from {len(pending)} archived files in "
+                  f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+        refs = archive.lookup(u_id=args.u_id, data_file=args.data_file, sha256=args.sha256, limit=args.limit)
+        for ref in refs:
+            print(json.dumps(ref))
+        print(f"{len(refs)} archived files", file=sys.stderr)
+        if args.restore:
+            os.makedirs(args.restore, exist_ok=True)
+            restored = set()
+            for ref in refs:
+                if ref["sha256"] in restored:
+                    continue
+                name = os.path.basename(ref["source_path"] or "") or ref["sha256"] + ".pdf"
+                out = os.path.join(args.restore, name)
+                if os.path.exists(out):
+                    out = os.path.join(args.restore, f"{ref['sha256'][:12]}_{name}")
+                with open(out, "wb") as f:
+                    f.write(archive.read(ref["sha256"]))
+                restored.add(ref["sha256"])
+                print(f"Restored {out}", file=sys.stderr)
+        if args.traces:
+            os.makedirs(args.traces, exist_ok=True)
+            written = set()
+            for ref in refs:
+                if ref["sha256"] in written:
+                    continue
+                written.add(ref["sha256"])
+                name = os.path.splitext(os.path.basename(ref["data_file"] or ""))[0] or ref["sha256"][:12]
+                for trace in archive.traces(ref["sha256"]):
+                    out = os.path.join(args.traces, f"{name}_{ref['sha256'][:8]}_p{trace['page'] + 1}_{trace['trace'] + 1}.csv")
+                    with open(out, "w", newline="", encoding="utf-8") as f:
+                        writer = csv.writer(f)
+                        writer.writerow(["time_min", f"signal_{trace['unit'] or 'value'}"])
+                        writer.writerows((f"{t:.5f}", f"{v:.4f}") for t, v in zip(trace["times"], trace["values"]))
+                    print(f"Wrote {out} ({len(trace['times'])} points)", file=sys.stderr)
+    finally:
+        archive.close()
+
+
+def cli_replay(args):
+    paths = []
+    for pattern in args.logs or ["log_*.txt", "audit_*.jsonl", "audit_*.jsonl.gz"]:
+        paths.extend(sorted(glob.glob(pattern)) or ([pattern] if os.path.exists(pattern) else []))
+    if not paths:
+        print("No log files found", file=sys.stderr)
+        return
+
+    def progress(stats):
+        rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0
+        print(f"\r{stats['read']} rows read, {stats['inserted']} inserted ({rate:,.0f} rows/s)",
+              end="", file=sys.stderr, flush=True)
+    storage = get_storage()
+    storage.init_schema()  # replaying into a fresh database
+    stats = replay_logs(storage, paths, chunk_size=args.chunk_size, progress=progress)
+    rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"\nReplayed {len(paths)} files: {stats['read']} rows read, {stats['inserted']} missing rows inserted "
+          f"in {stats['seconds']:.1f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+    return {"files": len(paths), "rows": stats["read"]}
+
+
+def cli_rebuild_summary(args):
+    """Recompute shimadzu_dissolution_summary from the raw table (for rows inserted before it existed)"""
+    storage = get_storage()
+    conn = storage.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM shimadzu_dissolution_summary")
+        cols = DISSOLUTION_SUMMARY_KEY + ["title", "area"]
+        last_id, total = 0, 0
+        while True:
+            cursor.execute(f"SELECT id, {', '.join(cols)} FROM shimadzu_dissolution_raw WHERE id > %s "
+                           f"ORDER BY id LIMIT %s", (last_id, args.chunk_size))
+            found = cursor.fetchall()
+            if not found:
+                break
+            last_id = found[-1][0]
+            update_dissolution_summary(storage, cursor, [dict(zip(cols, r[1:])) for r in found])
+            total += len(found)
+            print(f"\r{total} raw rows", end="", file=sys.stderr, flush=True)
+        conn.commit()
+        print(f"\nDissolution summary rebuilt from {total} rows", file=sys.stderr)
+    finally:
+        conn.close()
+
+
+def cli_migrate_schema(args):
+    storage = get_storage()
+    copied = migrate_to_normalized(storage, chunk_size=args.chunk_size,
+                                   progress=lambda table, n: print(f"\r{table}: {n} rows", end="", file=sys.stderr, flush=True))
+    print("", file=sys.stderr)
+    for table, n in copied.items():
+        print(f"{table}: {n} rows moved to shimadzu_injection/shimadzu_peak, old table kept as {table}_flat",
+              file=sys.stderr)
+    if not copied:
+        print("Nothing to migrate", file=sys.stderr)
+        return
+    # Row ids changed, so the local mirror is rebuilt from scratch on the next sync
+    if os.path.exists(args.mirror):
+        mirror = LocalMirror(args.mirror)
+        mirror.reset()
+        mirror.close()
+        print("Local mirror cleared; run mirror-sync (or start the app) to refill it", file=sys.stderr)
+
+
+def synthetic_report(kind, station, seq, peaks):
+    """Parsed rows of one made-up report, shaped like the parser output for kind"""
+    rnd = random.Random(station * 100003 + seq)
+    header = {
+        "machine_id": f"LOAD{station:02d}", "u_id": f"LOADTEST-{station}-{seq}", "user_id": "loadtest",
+        "test_code": DISSOLUTION_TEST_CODES[0] if kind == "dissolution" else ASSAY_TEST_CODES[0],
+        "acquired_by": "System Administrator", "sample_name_header": f"Sample {seq}", "sample_id": f"S{seq:05d}",
+        "tray": 1, "vial": seq % 100 + 1, "injection_volume": 10.0,
+        "data_file": f"LOAD{station:02d}_{seq:05d}.lcd", "method_file": "loadtest.lcm",
+        "batch_file": f"LOAD{station:02d}.lcb", "report_format_file": "loadtest.lcr",
+        "date_acquired": datetime.now().strftime("%m/%d/%Y %I:%M:%S %p"),
+        "date_processed": datetime.now().strftime("%m/%d/%Y %I:%M:%S %p"),
+    }
+    compounds = ["Compound A", "Compound B"] if kind == "multi" else [""]
+    rows = []
+    for compound in compounds:
+        for i in range(peaks):
+            row = dict(header, title=f"STD{i + 1}", sample_name=f"Sample {seq}", sample_id_ind=f"S{seq:05d}",
+                       ret_time=round(rnd.uniform(2, 12), 3), area=round(rnd.uniform(1e4, 1e6), 1),
+                       tailing_factor=round(rnd.uniform(0.9, 1.5), 3), theoretical_plate=round(rnd.uniform(4e3, 2e4)))
+            if kind == "multi":
+                row["compound_name"] = compound
+            if kind == "dissolution":
+                # The dissolution writers store every value as text
+                row = {k: str(v) for k, v in row.items()}
+                row.update(height=str(round(rnd.uniform(1e3, 1e5))), component_type="single",
+                           process_type="immediate", medium_name="0.1N HCl", stage=DISSOLUTION_STAGES[2],
+                           vessel_id=str(i % 6 + 1), compound_name="Compound A")
+            rows.append(row)
+    return rows
+
+
+def _loadtest_station(station, files, kinds, peaks, backend, path, start_at):
+    """One simulated workstation (runs in its own process); returns its per-file latencies and counts"""
+    # The app's insert path with this workstation's own write slots and no sinks (preview, mirror, audit log)
+    ingestor = ReportIngestor(SQLiteBackend(path) if backend == "sqlite" else MySQLBackend())
+    writers = {"single": ingestor.insert_single_db, "multi": ingestor.insert_multi_db,
+               "dissolution": ingestor.write_dissolution_rows}
+    latencies, rows, errors = [], 0, 0
+    time.sleep(max(0.0, start_at - time.time()))  # every station starts together
+    for seq in range(files):
+        kind = kinds[seq % len(kinds)]
+        report = synthetic_report(kind, station, seq, peaks)
+        started = time.perf_counter()
+        try:
+            ok = writers[kind](report) is not False
+        except Exception:  # DBUnavailableError, or a dissolution write error
+            ok = False
+        latencies.append(time.perf_counter() - started)
+        if ok:
+            rows += len(report)
+        else:
+            errors += 1
+    ingestor.storage.close()
+    return {"latencies": latencies, "rows": rows, "errors": errors,
+            "retries": ingestor.retries, "lock_retries": ingestor.lock_retries}
+
+
+def _innodb_lock_status(storage):
+    """Server-wide InnoDB row lock counters (waits, total wait ms)"""
+    conn = storage.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%'")
+        status = {k: int(v) for k, v in cursor.fetchall()}
+        return status.get("Innodb_row_lock_waits", 0), status.get("Innodb_row_lock_time", 0)
+    finally:
+        conn.close()
+
+
+def cli_loadtest(args):
+    """Simulate N workstations writing at once, for each N in --stations"""
+    kinds = [k.strip() for k in args.mix.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in INSERT_TARGETS]
+    if not kinds or unknown:
+        print(f"--mix takes a list of {', '.join(INSERT_TARGETS)}", file=sys.stderr)
+        return
+    if args.backend == "sqlite":
+        if args.fresh:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+        storage = SQLiteBackend(args.db)
+        print(f"SQLite stand-in: {args.db}", file=sys.stderr)
+    else:
+        storage = MySQLBackend()
+        print(f"MySQL/MariaDB from {DB_CONFIG_FILE}: rows are tagged u_id LOADTEST-*", file=sys.stderr)
+    storage.init_schema()
+
+    print(f"{'stations':>8} {'files':>6} {'rows':>7} {'files/s':>8} {'rows/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'retries':>7} {'lock':>5} {'errors':>6}" +
+          (f" {'row lock waits':>14} {'wait ms':>8}" if args.backend == "mysql" else ""))
+    totals = {"files": 0, "rows": 0}
+    for n in sorted({int(x) for x in args.stations.split(",") if x.strip()}):
+        locks_before = _innodb_lock_status(storage) if args.backend == "mysql" else None
+        with ProcessPoolExecutor(max_workers=n) as pool:
+            start_at = time.time() + 1.0 + 0.1 * n  # room for the workers to spawn
+            futures = [pool.submit(_loadtest_station, station, args.files, kinds, args.peaks, args.backend,
+                                   args.db, start_at) for station in range(n)]
+            results = [f.result() for f in futures]
+        seconds = max(time.time() - start_at, 1e-9)
+        latencies = sorted(l for r in results for l in r["latencies"])
+        pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+        files, rows = len(latencies), sum(r["rows"] for r in results)
+        errors = sum(r["errors"] for r in results)
+        line = (f"{n:>8} {files:>6} {rows:>7} {files / seconds:>8.1f} {rows / seconds:>8.0f} {pct(0.5):>8.1f} "
+                f"{pct(0.95):>8.1f} {pct(0.99):>8.1f} {latencies[-1] * 1000:>8.1f} "
+                f"{sum(r['retries'] for r in results):>7} {sum(r['lock_retries'] for r in results):>5} "
+                f"{errors:>6}")
+        if locks_before is not None:
+            waits, wait_ms = _innodb_lock_status(storage)
+            line += f" {waits - locks_before[0]:>14} {wait_ms - locks_before[1]:>8}"
+        print(line + (f"  ({errors / files:.1%} failed)" if errors else ""))
+        totals["files"] += files
+        totals["rows"] += rows
+    return totals
+
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(prog="main.py", description="Shimadzu LC-2050 Data Manager tools")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write profile_*.pstats and a collapsed-stack file for this run")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Stream a result table to CSV or Parquet")
+    p.add_argument("--table", required=True, choices=list(RESULT_TABLES))
+    p.add_argument("--out", required=True, help="Output file (.csv or .parquet)")
+    p.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the output file extension")
+    p.add_argument("--u-id", dest="u_id")
+    p.add_argument("--test-code", dest="test_code")
+    p.add_argument("--machine-id", dest="machine_id")
+    p.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", help="YYYY-MM-DD (inclusive)")
+    p.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    p.set_defaults(func=cli_export)
+
+    p = sub.add_parser("mirror-sync", help="Pull new central DB rows into the local SQLite mirror")
+    p.add_argument("--mirror", default=LOCAL_MIRROR_FILE)
+    p.set_defaults(func=cli_mirror_sync)
+
+    p = sub.add_parser("audit", help="Look up audit log records by u_id, sample_id or data file")
+    p.add_argument("--u-id", dest="u_id")
+    p.add_argument("--sample-id", dest="sample_id")
+    p.add_argument("--data-file", dest="data_file")
+    p.add_argument("--limit", type=int, default=100)
+    p.add_argument("--dir", default=".", help="Folder holding audit_*.jsonl and the index")
+    p.set_defaults(func=cli_audit)
+
+    p = sub.add_parser("archive", help="Find archived PDFs by u_id, data file or hash and optionally restore them")
+    p.add_argument("--u-id", dest="u_id")
+    p.add_argument("--data-file", dest="data_file")
+    p.add_argument("--sha256")
+    p.add_argument("--limit", type=int, default=100)
+    p.add_argument("--restore", metavar="DIR", help="Write the matching PDFs into this folder")
+    p.add_argument("--traces", metavar="DIR", help="Write the chromatogram traces of the matching PDFs as CSV")
+    p.add_argument("--extract-traces", action="store_true",
+                   help="Extract traces of archived PDFs that have none yet (archived without SHIMADZU_TRACES)")
+    p.add_argument("--dir", default=ARCHIVE_DIR, help="Archive folder")
+    p.set_defaults(func=cli_archive)
+
+    p = sub.add_parser("replay", help="Re-insert rows from daily/audit logs that are missing in the DB")
+    p.add_argument("logs", nargs="*", help="Log files or patterns (default: log_*.txt and audit_*.jsonl*)")
+    p.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK)
+    p.set_defaults(func=cli_replay)
+
+    p = sub.add_parser("rebuild-summary", help="Recompute the dissolution summary table from the raw rows")
+    p.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    p.set_defaults(func=cli_rebuild_summary)
+
+    p = sub.add_parser("migrate-schema", help="Move the result tables to the normalized injection/peak layout")
+    p.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    p.add_argument("--mirror", default=LOCAL_MIRROR_FILE)
+    p.set_defaults(func=cli_migrate_schema)
+
+    p = sub.add_parser("loadtest", help="Simulate several workstations writing at once and report the write path")
+    p.add_argument("--stations", default="1,5,10,20", help="Comma-separated concurrency levels")
+    p.add_argument("--files", type=int, default=50, help="Reports written by each station per level")
+    p.add_argument("--peaks", type=int, default=6, help="Peak rows per report (per compound)")
+    p.add_argument("--mix", default="single,multi,dissolution", help="Report kinds, cycled per station")
+    p.add_argument("--backend", choices=STORAGE_BACKENDS, default="sqlite",
+                   help="sqlite: a stand-in file (--db); mysql: the server in DB Settings (use a scratch DB)")
+    p.add_argument("--db", default=LOADTEST_DB_FILE, help="SQLite stand-in file")
+    p.add_argument("--fresh", action="store_true", help="Delete the SQLite stand-in first")
+    p.set_defaults(func=cli_loadtest)
+
+    args = parser.parse_args(argv)
+    profiler = BatchProfiler(args.command).start() if args.profile else None
+    tags = {}
+    try:
+        tags = args.func(args) or {}
+    finally:
+        if profiler is not None:
+            print(f"Profile written: {profiler.stop(**tags)}.pstats / .collapsed", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    app = ShimadzuPDFApp()
-    app.mainloop()
\ No newline at end of file
+    multiprocessing.freeze_support()  # PDF extraction workers in the frozen .exe
+    if len(sys.argv) > 1 and sys.argv[1:] != ["--profile"]:
+        run_cli(sys.argv[1:])
+    else:
+        app = ShimadzuPDFApp()
+        app.profile_always = "--profile" in sys.argv  # profile every ingestion run of this session
+        app.mainloop()
\ No newline at end of file